@@ -5,13 +5,22 @@ import os
 import sys
 import time
 import atexit
+import signal
+import ctypes
+import threading
 import traceback
 from datetime import datetime
 
 from src.lock_manager import LockManager
 from src.logger import logger
-from src.schedule_manager import scheduler
 from src.watchdog import AppWatchdog
+from src.dir_watch import FILE_NOTIFY_CHANGE_FILE_NAME, INFINITE, INVALID_HANDLE_VALUE, WAIT_OBJECT_0
+
+if os.name == 'nt':
+    from src.dir_watch import (
+        FindFirstChangeNotificationW, FindNextChangeNotification,
+        FindCloseChangeNotification, WaitForSingleObject, GetLastError,
+    )
 
 
 # ============================================
@@ -31,37 +40,273 @@ CONFIG = {
 CONFIG["check_interval"] = CONFIG["check_interval_minutes"] * 60
 CONFIG["wait_after_action"] = CONFIG["wait_after_action_minutes"] * 60
 
+# Directorio del script/exe y ruta de stop.txt (no cambian durante la ejecución)
+if getattr(sys, 'frozen', False):
+    # Running as exe
+    _SCRIPT_DIR = os.path.dirname(sys.executable)
+else:
+    # Running as script
+    _SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+_STOP_FILE = os.path.join(_SCRIPT_DIR, "stop.txt")
+
+# Se activa por señal, por el evento de Windows o por stop.txt
+_stop_event = threading.Event()
+_stop_source = None  # Fuente del stop (para log y status.txt); la primera que llega gana
+
+# Eventos de SetConsoleCtrlHandler (wincon.h)
+CTRL_CLOSE_EVENT = 2
+CTRL_LOGOFF_EVENT = 5
+CTRL_SHUTDOWN_EVENT = 6
+_console_ctrl_handler = None
+
 
-def interruptible_sleep(seconds):
+def _request_stop(source):
+    """Activa _stop_event registrando quién lo pidió ("stop.txt", "SIGTERM", ...)"""
+    global _stop_source
+    if _stop_source is None:
+        _stop_source = source
+    _stop_event.set()
+
+
+def _stop_exists():
     """
-    Duerme en chunks de 10 segundos, verificando stop.txt cada vez.
-    Retorna True si se detectó stop.txt, False si completó el sleep normal.
+    ¿Existe stop.txt? Un solo os.stat; solo "no existe" cuenta como False.
+    Otros errores (ej. EACCES en red) se propagan en lugar de ocultarse.
     """
-    elapsed = 0
-    chunk = 10  # Verificar cada 10 segundos
-    
-    # Obtener directorio del script/exe
-    if getattr(sys, 'frozen', False):
-        # Running as exe
-        script_dir = os.path.dirname(sys.executable)
-    else:
-        # Running as script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    stop_file = os.path.join(script_dir, "stop.txt")
+    try:
+        os.stat(_STOP_FILE)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _consume_stop_file():
+    """
+    Detecta y elimina stop.txt en un solo os.unlink (sin stat previo ni carrera
+    entre quien lo detecta y quien lo borra). Retorna True si había stop.txt.
+    """
+    try:
+        os.unlink(_STOP_FILE)
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        # Existe pero no se pudo borrar: igual cuenta como pedido de stop
+        logger.warning("[STOP] ⚠️ No se pudo eliminar stop.txt: %s", e)
+        _request_stop("stop.txt")
+        return True
+    logger.info("[STOP] 🗑️ stop.txt eliminado")
+    _request_stop("stop.txt")
+    return True
+
+
+def _watch_stop_file():
+    """
+    Hilo que espera notificaciones del sistema de archivos sobre _SCRIPT_DIR
+    (FindFirstChangeNotificationW) y activa _stop_event cuando aparece stop.txt.
+    Sin polling: el hilo solo despierta cuando se crea/renombra/borra un archivo.
+    """
+    handle = FindFirstChangeNotificationW(_SCRIPT_DIR, False, FILE_NOTIFY_CHANGE_FILE_NAME)
+    if handle in (None, INVALID_HANDLE_VALUE):
+        logger.warning("⚠️ No se pudo vigilar %s (error %s) - stop.txt solo por polling", _SCRIPT_DIR, GetLastError())
+        return
+
+    try:
+        while not _stop_event.is_set():
+            if WaitForSingleObject(handle, INFINITE) != WAIT_OBJECT_0:
+                break
+            try:
+                found = _stop_exists()
+            except OSError:
+                found = False  # Error transitorio: esperar la siguiente notificación
+            if found:
+                _request_stop("stop.txt")
+                break
+            if not FindNextChangeNotification(handle):
+                break
+    finally:
+        FindCloseChangeNotification(handle)
+
+
+def install_stop_signals(lock_manager):
+    """
+    Registra las fuentes de stop que no requieren polling:
+    - POSIX/consola: SIGTERM y SIGINT (Ctrl+C) activan _stop_event
+    - Windows: evento con nombre del LockManager, esperado por su hilo listener
+    - Windows: aparición de stop.txt, vía notificaciones del directorio
+    """
+    def _on_signal(signum, frame):
+        _request_stop("usuario (Ctrl+C)" if signum == signal.SIGINT else signal.Signals(signum).name)
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    if os.name != 'nt':
+        return
+
+    threading.Thread(target=_watch_stop_file, daemon=True).start()
+
+    if lock_manager.start_stop_listener(lambda: _request_stop("evento de stop (--stop)")):
+        logger.info(f"📡 Evento de stop registrado: {LockManager.STOP_EVENT_NAME}")
+
+
+def install_console_ctrl_handler(cleanup):
+    """
+    Registra un handler de consola de Windows (SetConsoleCtrlHandler) que ejecuta
+    cleanup() en cierre de consola, logoff o apagado. atexit NO corre en esos
+    eventos, y sin esto el watchdog.lock queda huérfano hasta el siguiente arranque.
+
+    Ctrl+C / Ctrl+Break se dejan pasar (return False) para que los maneje
+    Python vía SIGINT/SIGBREAK.
+    """
+    global _console_ctrl_handler
+    if os.name != 'nt':
+        return
+
+    def _handler(ctrl_type):
+        if ctrl_type in (CTRL_CLOSE_EVENT, CTRL_LOGOFF_EVENT, CTRL_SHUTDOWN_EVENT):
+            try:
+                cleanup()
+            except Exception:
+                pass
+            return True
+        return False
+
+    # Guardar referencia al callback: si el GC lo libera, Windows llamaría memoria inválida
+    _console_ctrl_handler = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_uint)(_handler)
+    if not ctypes.windll.kernel32.SetConsoleCtrlHandler(_console_ctrl_handler, True):
+        logger.warning(f"⚠️ No se pudo registrar SetConsoleCtrlHandler (error {ctypes.windll.kernel32.GetLastError()})")
+
+
+def signal_running_watchdog():
+    """
+    Señala el evento de stop de un watchdog en ejecución (modo --stop).
+
+    Returns:
+        True si se pudo señalar, False si no hay watchdog escuchando
+    """
+    if os.name != 'nt':
+        print("❌ --stop solo está disponible en Windows (usa SIGTERM en POSIX)")
+        return False
+
+    if not LockManager.signal_stop():
+        print("❌ No hay watchdog escuchando el evento de stop")
+        return False
+    return True
+
+
+def interruptible_sleep(seconds, on_tick=None):
+    """
+    Duerme en chunks de hasta 60 segundos esperando _stop_event, verificando stop.txt cada vez.
+    El evento despierta al instante; stop.txt es el respaldo y se detecta en <= 60s.
+    Si se pasa on_tick, se llama al final de cada chunk (ej. refrescar watchdog.lock)
+    para aprovechar el mismo despertar en lugar de tener otro reloj aparte.
+    Retorna True si se pidió stop (evento o stop.txt), False si completó el sleep normal.
+    Si el stop vino por stop.txt, el archivo ya queda eliminado al retornar.
+    """
+    chunk = 60  # Verificar stop.txt / llamar on_tick cada 60 segundos
+    # Reloj monotónico: inmune a cambios de hora/DST y más barato que datetime.now()
+    deadline = time.monotonic() + seconds
     
-    while elapsed < seconds:
-        if os.path.exists(stop_file):
-            return True  # Señal de stop detectada
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        
+        if _consume_stop_file():
+            return True  # Señal de stop detectada (stop.txt ya eliminado)
+        
+        # Esperar el menor entre: tiempo restante o chunk (despierta al instante si hay stop)
+        if _stop_event.wait(min(chunk, remaining)):
+            _consume_stop_file()  # Si lo despertó el watcher de stop.txt, borrarlo aquí
+            return True
         
-        # Dormir el menor entre: tiempo restante o chunk
-        sleep_time = min(chunk, seconds - elapsed)
-        time.sleep(sleep_time)
-        elapsed += sleep_time
+        if on_tick:
+            on_tick()
     
     return False  # Sleep completado sin interrupción
 
 
+def _valid_range(start, end):
+    """Rango [start, end) dentro del día; uno que cruce medianoche va partido: (22, 24), (0, 6)"""
+    return 0 <= start <= end <= 24
+
+
+def schedule_mask(time_ranges):
+    """
+    Compila time_ranges a un bitmask de 24 bits: bit h encendido si la hora h
+    está en horario. La verificación por ciclo queda en (mask >> hora) & 1.
+    Los rangos inválidos se registran y se ignoran.
+    """
+    mask = 0
+    for start, end in time_ranges:
+        if not _valid_range(start, end):
+            logger.warning("⚠️ Rango de horario inválido (%s, %s) ignorado - usar 0 <= inicio <= fin <= 24", start, end)
+            continue
+        mask |= ((1 << (end - start)) - 1) << start
+    return mask
+
+
+def next_start_table(time_ranges):
+    """
+    Tabla de 24 entradas: para cada hora h, la hora de inicio del siguiente
+    rango (o el primero de mañana). Fuera de horario se consulta por índice.
+    Ignora los mismos rangos inválidos que schedule_mask.
+    """
+    # Sin rangos válidos nunca se está en horario: esperar de 0:00 en 0:00
+    starts = sorted(start for start, end in time_ranges if _valid_range(start, end)) or [0]
+    return [next((start for start in starts if start > h), starts[0]) for h in range(24)]
+
+
+# Log de errores por ciclo: fd en modo append abierto en el primer error (no en el
+# arranque: un archivo de diagnóstico no debe impedir que el watchdog inicie)
+_error_log_fd = None
+
+
+def write_error_log(entry):
+    """
+    Agrega entry a watchdog_errors.log con un único os.write (sin TextIOWrapper).
+    El fd se abre una vez y se reutiliza; si no se puede abrir/escribir, se ignora
+    y el próximo error lo vuelve a intentar.
+    """
+    global _error_log_fd
+    try:
+        if _error_log_fd is None:
+            _error_log_fd = os.open("watchdog_errors.log", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(_error_log_fd, entry.encode("utf-8"))
+    except OSError:
+        pass
+
+
+def close_error_log():
+    """Cierra el fd de watchdog_errors.log si llegó a abrirse"""
+    global _error_log_fd
+    fd, _error_log_fd = _error_log_fd, None
+    if fd is not None:
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def seconds_until(hour, now):
+    """
+    Segundos desde now (time.struct_time) hasta hour:00 de hoy o de mañana,
+    directo de los campos de localtime. Nunca 0: a hour:00:00 exacto son 24h.
+    """
+    elapsed = now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec
+    return (hour * 3600 - elapsed) % 86400 or 86400
+
+
+def handle_stop_detected(context):
+    """
+    Registra el stop con su fuente (señal, evento o stop.txt) y actualiza status.txt.
+    stop.txt ya lo eliminó _consume_stop_file; el caller hace break.
+    """
+    source = _stop_source or "stop.txt"
+    logger.info("[STOP] 🛑 Stop pedido por %s %s. Saliendo del watchdog...", source, context)
+    logger.status(f"🛑 Detenido por {source}")
+
+
 def check_startup_stop_file():
     """
     Verifica stop.txt al inicio del watchdog.
@@ -69,20 +314,12 @@ def check_startup_stop_file():
     Returns:
         True si debe continuar, False si debe detenerse
     """
-    # Determinar ruta del stop.txt
-    if getattr(sys, 'frozen', False):
-        script_dir = os.path.dirname(sys.executable)
-    else:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    stop_file = os.path.join(script_dir, "stop.txt")
-    
-    if not os.path.exists(stop_file):
-        return True  # No existe, continuar
-    
     try:
+        if not _stop_exists():
+            return True  # No existe, continuar
+        
         # Leer contenido del archivo
-        with open(stop_file, 'r', encoding='utf-8') as f:
+        with open(_STOP_FILE, 'r', encoding='utf-8') as f:
             content = f.read().strip()
         
         # Si contiene "FROZEN" (case-insensitive), detener y mantener archivo
@@ -93,7 +330,7 @@ def check_startup_stop_file():
         
         # Si está vacío o contiene cualquier otro texto, eliminar y continuar
         logger.info(f"🗑️ stop.txt encontrado (contenido: '{content[:20]}...') - Eliminando y continuando")
-        os.remove(stop_file)
+        os.remove(_STOP_FILE)
         logger.info("✅ stop.txt eliminado, watchdog continuará")
         return True
         
@@ -106,29 +343,33 @@ def main():
     """Función principal"""
     
     try:
-        # Mostrar banner
-        logger.info("=" * 60)
-        logger.info("🛡️  WATCHDOG 1.8.4")
-        logger.info(f"📅 Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        logger.info(f"📌 CWD: {os.getcwd()}")
-        logger.info(f"📌 Frozen: {getattr(sys, 'frozen', False)}")
-        logger.info(f"📌 sys.executable: {sys.executable}")
-        logger.info(f"📌 __file__: {__file__}")
-        logger.info("=" * 60)
+        # Mostrar banner (una sola escritura al log)
+        logger.info("\n".join([
+            "=" * 60,
+            "🛡️  WATCHDOG 1.8.4",
+            f"📅 Inicio: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            f"📌 CWD: {os.getcwd()}",
+            f"📌 Frozen: {getattr(sys, 'frozen', False)}",
+            f"📌 sys.executable: {sys.executable}",
+            f"📌 __file__: {__file__}",
+            "=" * 60,
+        ]))
         
         # Verificar stop.txt al inicio
         if not check_startup_stop_file():
             return 1
         
         # Mostrar configuración
-        logger.info(f"⚙️  CONFIGURACIÓN:")
-        logger.info(f"   📱 App: {CONFIG['app_name']}")
-        logger.info(f"   🔒 Lock: {CONFIG['lock_file']}")
-        logger.info(f"   ⏱️  Timeout: {CONFIG['timeout_minutes']} min")
-        logger.info(f"   🔄 Revisión: cada {CONFIG['check_interval_minutes']} min")
         ranges_str = ", ".join([f"{start}:00-{end}:00" for start, end in CONFIG['time_ranges']])
-        logger.info(f"   🕐 Horario: {ranges_str}")
-        logger.info("=" * 60)
+        logger.info("\n".join([
+            "⚙️  CONFIGURACIÓN:",
+            f"   📱 App: {CONFIG['app_name']}",
+            f"   🔒 Lock: {CONFIG['lock_file']}",
+            f"   ⏱️  Timeout: {CONFIG['timeout_minutes']} min",
+            f"   🔄 Revisión: cada {CONFIG['check_interval_minutes']} min",
+            f"   🕐 Horario: {ranges_str}",
+            "=" * 60,
+        ]))
         
         # 1. INICIALIZAR WATCHDOG
         app_watchdog = AppWatchdog(
@@ -148,114 +389,145 @@ def main():
             logger.status("❌ ERROR: Otro watchdog activo")
             return 1
         
+        # 3. CONFIGURAR CLEANUP (se ejecuta incluso si crashea)
+        # Registrado apenas se adquiere el lock: si algo de aquí en adelante falla,
+        # atexit igual libera watchdog.lock y el mutex
+        exit_status = "💤 Watchdog detenido"
+        
+        def on_exit():
+            """Cleanup único de salida, en orden: lock, status, log"""
+            lock_manager.remove_lock()
+            logger.status(exit_status)
+            logger.info("👋 Watchdog finalizado")
+            close_error_log()
+            logger.close()
+        
+        atexit.register(on_exit)
+        
         # Lock ya fue creado por check_and_acquire()
         logger.info(f"🔒 Watchdog registrado (PID {os.getpid()})")
         
-        # 3. CONFIGURAR CLEANUP (se ejecuta incluso si crashea)
-        atexit.register(lambda: lock_manager.remove_lock())
-        atexit.register(lambda: logger.info("👋 Watchdog finalizado"))
-        atexit.register(lambda: logger.status("💤 Watchdog detenido"))
+        # 4. REGISTRAR FUENTES DE STOP SIN POLLING (señales / evento de Windows)
+        install_stop_signals(lock_manager)
         
-        # 4. REGISTRAR HANDLER PARA SEÑALES DE CRASH
+        # 5. REGISTRAR HANDLER PARA SEÑALES DE CRASH
         def handle_crash(signum=None, frame=None):
-            """Maneja crashes inesperados"""
+            """Maneja crashes inesperados; la limpieza la hace on_exit (atexit) al salir"""
+            nonlocal exit_status
             logger.error("💥 CRASH DETECTADO - Limpiando...")
-            lock_manager.remove_lock()
-            logger.status("💥 Watchdog crasheó")
+            exit_status = "💥 Watchdog crasheó"
             sys.exit(1)
         
-        # En Windows no hay señales UNIX, pero podemos registrar con atexit
-        atexit.register(handle_crash)
+        # Ctrl+Break / cierre de servicio en Windows llega como SIGBREAK.
+        # No se registra con atexit: on_exit ya limpia y sys.exit()
+        # dentro de atexit no tiene efecto. SIGINT/SIGTERM hacen stop ordenado
+        # vía _stop_event (install_stop_signals).
+        if hasattr(signal, 'SIGBREAK'):
+            signal.signal(signal.SIGBREAK, handle_crash)
+        
+        # Cierre de consola / logoff / apagado: atexit no corre, limpiar aquí
+        def handle_system_shutdown():
+            lock_manager.remove_lock()
+            logger.status("💥 Watchdog detenido por sistema")
+        
+        install_console_ctrl_handler(handle_system_shutdown)
         
         logger.status(f"✅ Activo | Robustez: ALTA | Revisión: {CONFIG['check_interval_minutes']}min")
         
     except Exception as e:
         # ERROR EN INICIALIZACIÓN - NO PODEMOS CONTINUAR
-        logger.error(f"💥 ERROR CRÍTICO en inicialización: {e}")
-        logger.error(f"📋 Traceback: {traceback.format_exc()}")
+        logger.exception("💥 ERROR CRÍTICO en inicialización: %s", e)
         logger.status(f"❌ ERROR INICIAL: {str(e)[:40]}...")
         
         # Registrar para diagnóstico
+        # os.open/os.write: sin capa de texto buffered, seguro aunque estemos en pleno shutdown
         try:
-            with open("watchdog_crash_init.log", "a") as f:
-                f.write(f"[{datetime.now()}] INIT CRASH: {str(e)}\n")
-                f.write(traceback.format_exc() + "\n")
+            fd = os.open("watchdog_crash_init.log", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, f"[{datetime.now()}] INIT CRASH: {str(e)}\n".encode("utf-8"))
+                os.write(fd, traceback.format_exc().encode("utf-8") + b"\n")
+            finally:
+                os.close(fd)
         except:
             pass
         
         return 1
     
-    # 5. LOOP PRINCIPAL CON RECUPERACIÓN POR CICLO
+    # 6. LOOP PRINCIPAL CON RECUPERACIÓN POR CICLO
     ciclo = 0
     ejecuciones = 0
     reinicios = 0
     errores_recientes = 0
     
-    # Refrescar watchdog.lock antes de que expire (LOCK_TIMEOUT_MINUTES=5)
-    last_lock_refresh = datetime.now()
-    lock_refresh_interval_seconds = 10  # Refrescar cada 10 segundos
+    # Refrescar watchdog.lock antes de que expire (LOCK_TIMEOUT_MINUTES=5):
+    # se llama en cada chunk de 60s de interruptible_sleep y al inicio de cada ciclo;
+    # refresh_lock solo toca el archivo cuando pasó la mitad de REFRESH_INTERVAL_SECONDS
+    refresh = lock_manager.refresh_lock
     
-    logger.info("🔁 Iniciando loop principal con recuperación...")
+    # Valores de CONFIG usados en cada ciclo: se leen una vez como locales
+    app_name = CONFIG["app_name"]
+    timeout_minutes = CONFIG["timeout_minutes"]
+    time_ranges = CONFIG["time_ranges"]
+    check_interval = CONFIG["check_interval"]
+    check_interval_minutes = CONFIG["check_interval_minutes"]
+    wait_after_action = CONFIG["wait_after_action"]
+    
+    # Horario precompilado una sola vez (bitmask por hora + texto para logs)
+    in_schedule_mask = schedule_mask(time_ranges)
+    next_start = next_start_table(time_ranges)
+    ranges_str = ", ".join([f"{start}:00-{end}:00" for start, end in time_ranges])
     
-    # Determinar ruta del stop.txt una vez
-    if getattr(sys, 'frozen', False):
-        script_dir = os.path.dirname(sys.executable)
-    else:
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-    stop_file = os.path.join(script_dir, "stop.txt")
+    def sleep_or_break(seconds, context):
+        """
+        interruptible_sleep + manejo de stop en un solo lugar.
+        Retorna True si se pidió stop (el caller debe hacer break).
+        """
+        if not interruptible_sleep(seconds, on_tick=refresh):
+            return False
+        handle_stop_detected(context)
+        return True
+    
+    logger.info("🔁 Iniciando loop principal con recuperación...")
     
     while True:
         try:
             # Mantener vivo el watchdog.lock para evitar que otro scheduler lo tome como huérfano
-            now = datetime.now()
-            if (now - last_lock_refresh).total_seconds() >= lock_refresh_interval_seconds:
-                lock_manager.refresh_lock()
-                last_lock_refresh = now
-
-            # Chequear archivo de stop para finalizar el watchdog
-            if os.path.exists(stop_file):
-                logger.info("[STOP] 🛑 stop.txt encontrado. Saliendo del watchdog...")
-                try:
-                    os.remove(stop_file)
-                    logger.info("[STOP] 🗑️ stop.txt eliminado")
-                except Exception as e:
-                    logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                logger.status("🛑 Detenido por stop.txt")
+            refresh()
+
+            # Chequear evento / archivo de stop para finalizar el watchdog
+            # (_consume_stop_file primero: si el evento lo activó el watcher, borra el archivo igual)
+            if _consume_stop_file() or _stop_event.is_set():
+                handle_stop_detected("al inicio del ciclo")
                 break
 
             ciclo += 1
-            hora_actual = datetime.now().strftime('%H:%M')
+            # Una sola lectura del reloj de pared por ciclo (log, horario y espera),
+            # con time.localtime() en vez de construir un datetime
+            now = time.localtime()
+            hora_actual = '%02d:%02d' % (now.tm_hour, now.tm_min)
             
-            logger.info(f"🔄 Ciclo #{ciclo} - {hora_actual}")
+            logger.info("🔄 Ciclo #%d - %s", ciclo, hora_actual)
             
             # Verificar si estamos en horario
-            current_hour = datetime.now().hour
-            in_schedule = any(start <= current_hour < end for start, end in CONFIG["time_ranges"])
+            in_schedule = bool((in_schedule_mask >> now.tm_hour) & 1)
             
             if in_schedule:
-                ranges_str = ", ".join([f"{start}:00-{end}:00" for start, end in CONFIG['time_ranges']])
-                logger.info(f"✅ En horario ({ranges_str})")
+                logger.info("✅ En horario (%s)", ranges_str)
                 
                 # Verificar estado de la app
                 estado = app_watchdog.check_app_status()
-                logger.info(f"📊 Estado: {estado}")
+                logger.info("📊 Estado: %s", estado)
                 
                 if estado == "not_running":
-                    logger.info(f"🚀 Ejecutando {CONFIG['app_name']}...")
-                    logger.status(f"🚀 Ejecutando {CONFIG['app_name']}...")
+                    logger.info("🚀 Ejecutando %s...", app_name)
+                    logger.status(f"🚀 Ejecutando {app_name}...")
                     
                     if app_watchdog.start_app():
                         ejecuciones += 1
-                        logger.info(f"✅ App iniciada (total: {ejecuciones})")
+                        errores_recientes = 0
+                        logger.info("✅ App iniciada (total: %d)", ejecuciones)
                         logger.status("✅ App en ejecución")
-                        if interruptible_sleep(CONFIG["wait_after_action"]):
-                            logger.info("[STOP] stop.txt detectado durante espera")
-                            try:
-                                os.remove(stop_file)
-                                logger.info("[STOP] 🗑️ stop.txt eliminado")
-                            except Exception as e:
-                                logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                            logger.status("🛑 Detenido por stop.txt")
+                        if sleep_or_break(wait_after_action, "durante espera"):
                             break
                     else:
                         logger.error("❌ Error al iniciar app")
@@ -263,34 +535,22 @@ def main():
                         errores_recientes += 1
                 
                 elif estado == "hung":
-                    logger.warning(f"⚠️ App colgada (> {CONFIG['timeout_minutes']}min)")
+                    logger.warning("⚠️ App colgada (> %smin)", timeout_minutes)
                     logger.status("⚠️ App colgada, reiniciando...")
                     
                     if app_watchdog.kill_app():
                         reinicios += 1
-                        logger.info(f"♻️ App terminada (reinicios: {reinicios})")
-                        if interruptible_sleep(10):
-                            logger.info("[STOP] stop.txt detectado durante espera")
-                            try:
-                                os.remove(stop_file)
-                                logger.info("[STOP] 🗑️ stop.txt eliminado")
-                            except Exception as e:
-                                logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                            logger.status("🛑 Detenido por stop.txt")
+                        errores_recientes = 0
+                        logger.info("♻️ App terminada (reinicios: %d)", reinicios)
+                        if sleep_or_break(10, "durante espera"):
                             break
                         
                         if app_watchdog.start_app():
                             ejecuciones += 1
+                            errores_recientes = 0
                             logger.info("✅ App reiniciada")
                             logger.status("✅ App reiniciada")
-                            if interruptible_sleep(CONFIG["wait_after_action"]):
-                                logger.info("[STOP] stop.txt detectado durante espera")
-                                try:
-                                    os.remove(stop_file)
-                                    logger.info("[STOP] 🗑️ stop.txt eliminado")
-                                except Exception as e:
-                                    logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                                logger.status("🛑 Detenido por stop.txt")
+                            if sleep_or_break(wait_after_action, "durante espera"):
                                 break
                         else:
                             logger.error("❌ Error al reiniciar")
@@ -306,88 +566,69 @@ def main():
                     logger.status("👍 App OK")
                     errores_recientes = 0
             else:
-                logger.info(f"😴 Fuera de horario")
-                current_hour = datetime.now().hour
-                next_range = min([start for start, end in CONFIG['time_ranges'] if start > current_hour], default=CONFIG['time_ranges'][0][0])
+                logger.info("😴 Fuera de horario")
+                next_range = next_start[now.tm_hour]
                 logger.status(f"💤 Durmiendo hasta {next_range}:00")
+                
+                # Sin trabajo hasta el siguiente horario: una sola espera larga en vez de
+                # despertar cada check_interval solo para loguear "fuera de horario"
+                sleep_secs = seconds_until(next_range, now)
+                logger.info("💤 Durmiendo hasta %02d:00 (%d minutos)...", next_range, sleep_secs // 60)
+                if sleep_or_break(sleep_secs, "durante sleep"):
+                    break
+                continue
             
-            minutos = CONFIG["check_interval_minutes"]
-            logger.info(f"💤 Durmiendo {minutos} minutos...")
-            if interruptible_sleep(CONFIG["check_interval"]):
-                logger.info("[STOP] stop.txt detectado durante sleep")
-                try:
-                    os.remove(stop_file)
-                    logger.info("[STOP] 🗑️ stop.txt eliminado")
-                except Exception as e:
-                    logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                logger.status("🛑 Detenido por stop.txt")
+            minutos = check_interval_minutes
+            logger.info("💤 Durmiendo %s minutos...", minutos)
+            if sleep_or_break(check_interval, "durante sleep"):
                 break
             
-        except KeyboardInterrupt:
-            logger.info("🛑 Detenido por usuario")
-            logger.status("🛑 Detenido por usuario")
-            break
-            
         except OSError as e:
             if hasattr(e, 'winerror') and e.winerror == 233:
-                logger.warning(f"⚠️  Broken pipe detectado en ciclo #{ciclo} (proceso terminado inesperadamente)")
+                logger.warning("⚠️  Broken pipe detectado en ciclo #%d (proceso terminado inesperadamente)", ciclo)
                 logger.info("🔄 Continuando con el siguiente ciclo...")
                 errores_recientes = 0
             else:
                 errores_recientes += 1
-                logger.error(f"⚠️  Error OS en ciclo #{ciclo}: {e}")
-                logger.error(f"📋 Traceback parcial: {traceback.format_exc()[:500]}...")
+                logger.exception("⚠️  Error OS en ciclo #%d: %s", ciclo, e, limit=-5)
                 logger.status(f"⚠️  Error temporal, continuando...")
             
         except Exception as e:
             errores_recientes += 1
-            logger.error(f"⚠️  Error en ciclo #{ciclo}: {e}")
-            logger.error(f"📋 Traceback parcial: {traceback.format_exc()[:500]}...")
+            logger.exception("⚠️  Error en ciclo #%d: %s", ciclo, e, limit=-5)
             logger.status(f"⚠️  Error temporal, continuando...")
             
-            try:
-                with open("watchdog_errors.log", "a") as f:
-                    f.write(f"[{datetime.now()}] CYCLE {ciclo} ERROR: {str(e)}\n")
-                    f.write(traceback.format_exc() + "\n")
-            except:
-                pass
+            write_error_log(f"[{datetime.now()}] CYCLE {ciclo} ERROR: {str(e)}\n{traceback.format_exc()}\n")
             
             if errores_recientes >= 3:
-                wait_time = 300
-                logger.warning(f"⚠️  Muchos errores seguidos ({errores_recientes}), esperando {wait_time//60} min...")
-                if interruptible_sleep(wait_time):
-                    logger.info("[STOP] stop.txt detectado durante espera de error")
-                    try:
-                        os.remove(stop_file)
-                        logger.info("[STOP] 🗑️ stop.txt eliminado")
-                    except Exception as e:
-                        logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                    logger.status("🛑 Detenido por stop.txt")
+                # Backoff exponencial: 5, 10, 20, 40 min... con tope de 1 hora
+                wait_time = min(300 * (1 << max(0, errores_recientes - 3)), 3600)
+                logger.warning("⚠️  Muchos errores seguidos (%s), esperando %s min...", errores_recientes, wait_time // 60)
+                if sleep_or_break(wait_time, "durante espera de error"):
                     break
             else:
-                if interruptible_sleep(CONFIG["check_interval"]):
-                    logger.info("[STOP] stop.txt detectado durante espera de error")
-                    try:
-                        os.remove(stop_file)
-                        logger.info("[STOP] 🗑️ stop.txt eliminado")
-                    except Exception as e:
-                        logger.warning(f"[STOP] ⚠️ No se pudo eliminar stop.txt: {e}")
-                    logger.status("🛑 Detenido por stop.txt")
+                if sleep_or_break(check_interval, "durante espera de error"):
                     break
     
-    logger.info("=" * 60)
-    logger.info(f"📊 RESUMEN FINAL:")
-    logger.info(f"   Ciclos completados: {ciclo}")
-    logger.info(f"   Ejecuciones de app: {ejecuciones}")
-    logger.info(f"   Reinicios por colgadas: {reinicios}")
-    logger.info(f"   Errores capturados: {errores_recientes}")
-    logger.info("=" * 60)
+    logger.info("\n".join([
+        "=" * 60,
+        "📊 RESUMEN FINAL:",
+        f"   Ciclos completados: {ciclo}",
+        f"   Ejecuciones de app: {ejecuciones}",
+        f"   Reinicios por colgadas: {reinicios}",
+        f"   Errores capturados: {errores_recientes}",
+        "=" * 60,
+    ]))
     logger.info("👋 Watchdog finalizado correctamente")
     
     return 0
 
 
 if __name__ == "__main__":
+    # Modo helper: señalar al watchdog en ejecución y salir
+    if "--stop" in sys.argv[1:]:
+        sys.exit(0 if signal_running_watchdog() else 1)
+    
     # Cambiar al directorio del script
     try:
         if getattr(sys, 'frozen', False):
@@ -0,0 +1,33 @@
+"""
+Notificaciones de cambios en un directorio (FindFirstChangeNotificationW)
+Prototipos y constantes compartidos por main.py (stop.txt) y watchdog.py (lock de la app)
+"""
+
+import os
+import ctypes
+
+# Windows API constants
+INFINITE = 0xFFFFFFFF
+WAIT_OBJECT_0 = 0
+FILE_NOTIFY_CHANGE_FILE_NAME = 0x00000001
+FILE_NOTIFY_CHANGE_LAST_WRITE = 0x00000010
+INVALID_HANDLE_VALUE = ctypes.c_void_p(-1).value
+
+# Prototipos de kernel32 definidos una sola vez (mismo esquema que lock_manager:
+# WinDLL propio, sin tocar los prototipos compartidos de ctypes.windll)
+if os.name == 'nt':
+    from ctypes import wintypes
+
+    _kernel32 = ctypes.WinDLL('kernel32')
+
+    def _proto(name, argtypes, restype):
+        fn = getattr(_kernel32, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+        return fn
+
+    FindFirstChangeNotificationW = _proto('FindFirstChangeNotificationW', [wintypes.LPCWSTR, wintypes.BOOL, wintypes.DWORD], wintypes.HANDLE)
+    FindNextChangeNotification = _proto('FindNextChangeNotification', [wintypes.HANDLE], wintypes.BOOL)
+    FindCloseChangeNotification = _proto('FindCloseChangeNotification', [wintypes.HANDLE], wintypes.BOOL)
+    WaitForSingleObject = _proto('WaitForSingleObject', [wintypes.HANDLE, wintypes.DWORD], wintypes.DWORD)
+    GetLastError = _proto('GetLastError', [], wintypes.DWORD)
@@ -5,22 +5,51 @@ Usa Windows Named Mutex para prevenir múltiples instancias de forma atómica
 
 import os
 import sys
-import json
 import time
-import subprocess
 import ctypes
-from datetime import datetime, timedelta
+import threading
 from pathlib import Path
 from .logger import logger
 
 # Windows API constants
 ERROR_ALREADY_EXISTS = 183
+EVENT_MODIFY_STATE = 0x0002
+WAIT_OBJECT_0 = 0
+INFINITE = 0xFFFFFFFF
+
+# Prototipos de kernel32 definidos una sola vez (argtypes/restype explícitos):
+# evita el lookup de atributo y la inferencia de tipos de ctypes en cada llamada.
+# Instancia WinDLL propia para no alterar los prototipos de ctypes.windll que usa main.py.
+if os.name == 'nt':
+    from ctypes import wintypes
+
+    _kernel32 = ctypes.WinDLL('kernel32')
+
+    def _proto(name, argtypes, restype):
+        fn = getattr(_kernel32, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+        return fn
+
+    _CreateMutexW = _proto('CreateMutexW', [wintypes.LPVOID, wintypes.BOOL, wintypes.LPCWSTR], wintypes.HANDLE)
+    _ReleaseMutex = _proto('ReleaseMutex', [wintypes.HANDLE], wintypes.BOOL)
+    _CreateEventW = _proto('CreateEventW', [wintypes.LPVOID, wintypes.BOOL, wintypes.BOOL, wintypes.LPCWSTR], wintypes.HANDLE)
+    _OpenEventW = _proto('OpenEventW', [wintypes.DWORD, wintypes.BOOL, wintypes.LPCWSTR], wintypes.HANDLE)
+    _SetEvent = _proto('SetEvent', [wintypes.HANDLE], wintypes.BOOL)
+    _WaitForSingleObject = _proto('WaitForSingleObject', [wintypes.HANDLE, wintypes.DWORD], wintypes.DWORD)
+    _CloseHandle = _proto('CloseHandle', [wintypes.HANDLE], wintypes.BOOL)
+    _GetLastError = _proto('GetLastError', [], wintypes.DWORD)
 
 class LockManager:
     """Maneja el lock file para prevenir múltiples instancias del watchdog"""
     
     LOCK_TIMEOUT_MINUTES = 5  # Más corto que 40min (para watchdog)
+    # Regla stale_age/2: el dueño refresca cada la mitad del timeout del lock
+    REFRESH_INTERVAL_SECONDS = LOCK_TIMEOUT_MINUTES * 60 // 2
+    # Mínimo entre escrituras reales del lock (ns enteros, comparación sin floats)
+    _refresh_gate_ns = REFRESH_INTERVAL_SECONDS * 1_000_000_000 // 2
     TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+    STOP_EVENT_NAME = "Global\\SmartDBFWatchdogStop"
     
     def __init__(self):
         # Determinar directorio del exe/script para ubicar el lock
@@ -33,8 +62,10 @@ class LockManager:
         
         self.lock_path = script_dir / "watchdog.lock"
         self.owns_lock = False
-        self._last_refresh = None
+        self._last_refresh_ns = 0
         self._mutex_handle = None
+        self._stop_event = None
+        self._stop_listener = None  # Hilo de start_stop_listener (remove_lock lo despierta)
     
     def check_and_acquire(self, max_retries=3) -> bool:
         """
@@ -52,159 +83,122 @@ class LockManager:
         
         try:
             # Crear o abrir el mutex
-            self._mutex_handle = ctypes.windll.kernel32.CreateMutexW(None, True, mutex_name)
-            last_error = ctypes.windll.kernel32.GetLastError()
+            self._mutex_handle = _CreateMutexW(None, True, mutex_name)
+            last_error = _GetLastError()
             
             if last_error == ERROR_ALREADY_EXISTS:
                 # Otro watchdog ya tiene el mutex
-                logger.warning(f"[LOCK] Otro watchdog activo (mutex ya existe)")
+                logger.warning("[LOCK] Otro watchdog activo (mutex ya existe)")
                 if self._mutex_handle:
-                    ctypes.windll.kernel32.CloseHandle(self._mutex_handle)
+                    _CloseHandle(self._mutex_handle)
                     self._mutex_handle = None
                 return False
             
-            logger.info(f"[LOCK] Mutex de Windows adquirido exitosamente (PID {os.getpid()})")
+            logger.info("[LOCK] Mutex de Windows adquirido exitosamente (PID %s)", os.getpid())
             
         except Exception as e:
-            logger.error(f"[LOCK] Error creando mutex de Windows: {e}")
+            logger.error("[LOCK] Error creando mutex de Windows: %s", e)
             return False
         
-        # PASO 2: Crear archivo de lock para compatibilidad y debugging
-        import random
+        # Evento de stop (auto-reset): solo el dueño del mutex lo escucha.
+        # Un proceso externo hace OpenEventW + SetEvent para pedir stop sin tocar disco.
+        self._stop_event = _CreateEventW(None, False, False, self.STOP_EVENT_NAME)
+        if not self._stop_event:
+            logger.warning("[LOCK] No se pudo crear evento de stop (error %s)", _GetLastError())
         
-        # Agregar un pequeño delay aleatorio para evitar race conditions en boot simultáneo
-        initial_delay = random.uniform(0.1, 0.5)  # 100-500ms
-        time.sleep(initial_delay)
-        logger.info(f"[LOCK] Delay inicial: {initial_delay:.3f}s para evitar race condition")
+        # PASO 2: Crear archivo de lock para compatibilidad y debugging
+        # (sin delay aleatorio: el mutex ya serializa arranques simultáneos)
         
         # CLAVE: Si tenemos el mutex pero existe un lock file, es definitivamente stale
         # El mutex es la fuente de verdad - si lo tenemos, ningún otro watchdog está corriendo
-        if self.lock_path.exists():
-            try:
-                with open(self.lock_path, 'r') as f:
-                    lock_data = json.load(f)
-                lock_pid = lock_data.get('pid', 0)
-                timestamp_str = lock_data.get('timestamp', '')
-                logger.info(f"[LOCK] Lock file huérfano encontrado (PID {lock_pid}, timestamp {timestamp_str})")
-                logger.info(f"[LOCK] Tenemos el mutex → lock es definitivamente stale, removiendo...")
-                self._remove_orphaned_lock()
-            except Exception as e:
-                logger.warning(f"[LOCK] Error leyendo lock huérfano: {e}, removiendo de todas formas...")
-                self.lock_path.unlink(missing_ok=True)
+        # Un solo stat (sin abrir ni parsear el JSON): FileNotFoundError = no hay huérfano.
+        # La antigüedad sale del mtime, que refresh_lock mantiene al día.
+        try:
+            mtime = os.stat(self.lock_path).st_mtime
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("[LOCK] Error leyendo lock huérfano: %s, removiendo de todas formas...", e)
+            self.lock_path.unlink(missing_ok=True)
+        else:
+            logger.info("[LOCK] Lock file huérfano encontrado (modificado hace %.1f min)", (time.time() - mtime) / 60)
+            logger.info("[LOCK] Tenemos el mutex → lock es definitivamente stale, removiendo...")
+            self._remove_orphaned_lock()
         
         for attempt in range(max_retries):
             if attempt > 0:
-                # Esperar un poco entre reintentos para evitar race conditions
-                wait_ms = attempt * 100  # 100ms, 200ms, etc.
-                time.sleep(wait_ms / 1000.0)
-                logger.info(f"[LOCK] Reintento {attempt + 1}/{max_retries}...")
+                logger.info("[LOCK] Reintento %s/%s...", attempt + 1, max_retries)
             
             # Crear el lock con modo exclusivo (falla si ya existe)
             # Esto previene race conditions entre múltiples procesos
             try:
-                # 'x' = exclusive creation, falla si el archivo existe
-                with open(self.lock_path, 'x') as f:
-                    lock_data = {
-                        "timestamp": datetime.now().strftime(self.TIMESTAMP_FORMAT),
-                        "pid": os.getpid(),
-                        "type": "watchdog"
-                    }
-                    json.dump(lock_data, f, indent=2)
+                self._create_lock_file()
                 
                 self.owns_lock = True
-                self._last_refresh = datetime.now()
-                logger.info(f"[LOCK] Lock creado exitosamente (PID {os.getpid()})")
-                
-                # Verificar que realmente somos dueños del lock
-                time.sleep(0.05)  # Esperar 50ms para que el sistema de archivos se sincronice
-                try:
-                    with open(self.lock_path, 'r') as f:
-                        verify_data = json.load(f)
-                    if verify_data.get('pid') != os.getpid():
-                        logger.error(f"[LOCK] VERIFICACIÓN FALLÓ: Lock tiene PID {verify_data.get('pid')}, esperábamos {os.getpid()}")
-                        self.owns_lock = False
-                        return False
-                    logger.info(f"[LOCK] Verificación OK - somos dueños del lock")
-                except Exception as e:
-                    logger.error(f"[LOCK] Error verificando lock: {e}")
-                    self.owns_lock = False
-                    return False
+                self._last_refresh_ns = time.monotonic_ns()
+                logger.info("[LOCK] Lock creado exitosamente (PID %s)", os.getpid())
                 
+                # No hace falta releer el lock para "verificar": la creación exclusiva
+                # ya garantiza que somos los dueños, y el mutex impide que otro watchdog compita
                 return True
                 
             except FileExistsError:
                 # Otro proceso creó el lock justo antes que nosotros
-                logger.warning(f"[LOCK] Race condition: otro watchdog creó el lock primero")
+                logger.warning("[LOCK] Race condition: otro watchdog creó el lock primero")
                 # Continuar al siguiente intento
                 continue
             except Exception as e:
-                logger.error(f"[LOCK] Error creando lock: {e}")
+                logger.error("[LOCK] Error creando lock: %s", e)
                 return False
         
         # Si llegamos aquí, todos los intentos fallaron
-        logger.error(f"[LOCK] No se pudo adquirir lock después de {max_retries} intentos")
+        logger.error("[LOCK] No se pudo adquirir lock después de %s intentos", max_retries)
         return False
     
-    def _get_system_boot_time(self) -> datetime:
-        """Obtiene el tiempo de arranque del sistema usando systeminfo de Windows."""
-        try:
-            result = subprocess.run(
-                ['systeminfo', '/FO', 'CSV'],
-                capture_output=True,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                timeout=10
-            )
-            
-            # Buscar la línea de System Boot Time
-            for line in result.stdout.split('\n'):
-                if 'System Boot Time' in line or 'Hora de inicio del sistema' in line:
-                    # Extraer el timestamp (formato puede variar según idioma)
-                    # Ejemplo: "...","1/23/2026, 8:00:00 AM","..."
-                    parts = line.split('","')
-                    if len(parts) >= 2:
-                        boot_time_str = parts[1].strip('"')
-                        # Intentar parsear varios formatos
-                        for fmt in ['%m/%d/%Y, %I:%M:%S %p', '%d/%m/%Y, %H:%M:%S', '%Y-%m-%d %H:%M:%S']:
-                            try:
-                                return datetime.strptime(boot_time_str, fmt)
-                            except:
-                                continue
-            
-            # Si no pudimos obtener el boot time, asumir que el sistema arrancó hace mucho tiempo
-            logger.warning("[LOCK] No se pudo obtener system boot time, asumiendo sistema antiguo")
-            return datetime.now() - timedelta(days=365)
-            
-        except Exception as e:
-            logger.warning(f"[LOCK] Error obteniendo boot time: {e}, asumiendo sistema antiguo")
-            return datetime.now() - timedelta(days=365)
+    def wait_stop(self, timeout_ms=INFINITE) -> bool:
+        """
+        Bloquea en el evento de stop de Windows (espera de kernel, sin polling).
+        
+        Returns:
+            True si alguien señaló el evento, False por timeout o si no hay evento
+        """
+        handle = self._stop_event
+        if not handle:
+            return False
+        signaled = _WaitForSingleObject(handle, int(timeout_ms)) == WAIT_OBJECT_0
+        # remove_lock también señala el evento (para despertar al hilo antes de
+        # cerrar el handle): eso no es un pedido de stop
+        return signaled and self._stop_event is not None
     
-    def _is_process_running(self, pid: int) -> bool:
-        """Verifica si un proceso con el PID dado está corriendo usando tasklist de Windows."""
-        try:
-            # Usar tasklist para verificar si el PID existe
-            result = subprocess.run(
-                ['tasklist', '/FI', f'PID eq {pid}', '/NH'],
-                capture_output=True,
-                text=True,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                timeout=5
-            )
-            
-            # Si el PID existe, tasklist lo mostrará en la salida
-            # Si no existe, dirá "INFO: No tasks are running..."
-            output = result.stdout.lower()
-            
-            # Verificar si el PID existe en la salida
-            # No verificamos el nombre porque puede ser python.exe (script) o watchdog.exe (compilado)
-            if 'info: no tasks' not in output and str(pid) in output:
-                return True
-            
+    def start_stop_listener(self, on_stop) -> bool:
+        """
+        Lanza un hilo daemon que espera el evento de stop y llama on_stop()
+        cuando otro proceso lo señala. El hilo termina solo en remove_lock.
+        
+        Returns:
+            True si se lanzó, False si no hay evento de stop (CreateEventW falló)
+        """
+        if not self._stop_event:
             return False
-            
-        except Exception:
-            # Si no podemos verificar, asumir que está corriendo (conservador)
-            return True
+        
+        def _run():
+            if self.wait_stop():
+                on_stop()
+        
+        self._stop_listener = threading.Thread(target=_run, daemon=True)
+        self._stop_listener.start()
+        return True
+    
+    @classmethod
+    def signal_stop(cls) -> bool:
+        """Señala el evento de stop del watchdog en ejecución (desde otro proceso)"""
+        handle = _OpenEventW(EVENT_MODIFY_STATE, False, cls.STOP_EVENT_NAME)
+        if not handle:
+            return False
+        try:
+            return bool(_SetEvent(handle))
+        finally:
+            _CloseHandle(handle)
     
     def create_lock(self):
         """
@@ -214,57 +208,114 @@ class LockManager:
         # Ya no se usa, check_and_acquire() crea el lock
         pass
     
+    def _create_lock_file(self):
+        """
+        Crea watchdog.lock de forma exclusiva (FileExistsError si ya existe).
+        El contenido se escribe primero en un tmp propio y se publica con os.link:
+        el link falla atómicamente si el destino existe y el lock aparece ya
+        completo, sin un handle abierto que el antivirus pueda retener.
+        """
+        payload = self._lock_payload()
+        tmp_path = self.lock_path.with_name(f"{self.lock_path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+        
+        try:
+            os.link(tmp_path, self.lock_path)
+        except FileExistsError:
+            raise
+        except OSError:
+            # Sistema de archivos sin hardlinks (FAT, algunos shares): O_EXCL directo
+            fd = os.open(self.lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+    
+    def _lock_payload(self) -> bytes:
+        """
+        Contenido del lock como JSON compacto en bytes (sin pasar por json.dumps).
+        "timestamp" es la hora de creación, no un heartbeat: refresh_lock solo
+        mueve el mtime, así que la vida del lock se lee de stat().st_mtime.
+        """
+        return b'{"timestamp":"%s","pid":%d,"type":"watchdog"}\n' % (
+            time.strftime(self.TIMESTAMP_FORMAT).encode('ascii'), os.getpid())
+    
     def refresh_lock(self) -> bool:
-        """Actualiza el timestamp del lock para indicar que seguimos vivos."""
+        """
+        Actualiza el mtime del lock (os.utime, sin reescribir el JSON) para
+        indicar que seguimos vivos. El campo "timestamp" del JSON queda con la
+        hora de creación: la antigüedad del lock se lee de stat().st_mtime.
+        No hace nada si ya se refrescó hace menos de la mitad de
+        REFRESH_INTERVAL_SECONDS.
+        """
         if not self.owns_lock:
             logger.warning("[LOCK] Intento de refresh sin poseer el lock")
             return False
-        if not self.lock_path.exists():
-            logger.error("[LOCK] Lock file desapareció - no se puede refrescar")
-            return False
+        if self._last_refresh_ns and time.monotonic_ns() - self._last_refresh_ns < self._refresh_gate_ns:
+            return True
 
         try:
-            lock_data = {
-                "timestamp": datetime.now().strftime(self.TIMESTAMP_FORMAT),
-                "pid": os.getpid(),
-                "type": "watchdog"
-            }
-            with open(self.lock_path, 'w') as f:
-                json.dump(lock_data, f, indent=2)
+            # Touch: una sola syscall, sin escritura parcial que un lector pueda ver.
+            # Si el lock desapareció no se recrea (utime falla con FileNotFoundError).
+            os.utime(self.lock_path, None)
 
-            self._last_refresh = datetime.now()
+            self._last_refresh_ns = time.monotonic_ns()
             return True
+        except FileNotFoundError:
+            logger.error("[LOCK] Lock file desapareció - no se puede refrescar")
+            return False
         except Exception as e:
-            logger.error(f"[LOCK] Error refrescando lock: {e}")
+            logger.error("[LOCK] Error refrescando lock: %s", e)
             return False
     
     def _remove_orphaned_lock(self):
         """Remueve lock file huérfano (de proceso anterior que crasheó)"""
         try:
-            if self.lock_path.exists():
-                self.lock_path.unlink()
-                logger.info("[LOCK] Lock huérfano removido")
+            self.lock_path.unlink(missing_ok=True)
+            logger.info("[LOCK] Lock huérfano removido")
         except Exception as e:
-            logger.error(f"[LOCK] Error removiendo lock: {e}")
+            logger.error("[LOCK] Error removiendo lock: %s", e)
     
     def remove_lock(self):
         """Remueve nuestro lock (al salir normalmente)"""
         # Liberar mutex de Windows
-        if self._mutex_handle:
+        # Idempotente: el handle se suelta antes de usarlo, una segunda llamada
+        # no hace ReleaseMutex/CloseHandle sobre un handle ya cerrado
+        handle, self._mutex_handle = self._mutex_handle, None
+        if handle:
             try:
-                ctypes.windll.kernel32.ReleaseMutex(self._mutex_handle)
-                ctypes.windll.kernel32.CloseHandle(self._mutex_handle)
-                self._mutex_handle = None
+                _ReleaseMutex(handle)
+                _CloseHandle(handle)
                 logger.info("[LOCK] Mutex de Windows liberado")
             except Exception as e:
-                logger.error(f"[LOCK] Error liberando mutex: {e}")
+                logger.error("[LOCK] Error liberando mutex: %s", e)
+        
+        # Cerrar evento de stop: primero SetEvent para que el hilo de
+        # start_stop_listener salga de WaitForSingleObject (cerrar un handle
+        # mientras otro hilo espera en él es comportamiento indefinido)
+        stop_event, self._stop_event = self._stop_event, None
+        listener, self._stop_listener = self._stop_listener, None
+        if stop_event:
+            try:
+                _SetEvent(stop_event)
+                if listener is not None and listener is not threading.current_thread():
+                    listener.join(1)
+                _CloseHandle(stop_event)
+            except Exception as e:
+                logger.error("[LOCK] Error cerrando evento de stop: %s", e)
         
         # Remover archivo de lock
-        if self.owns_lock and self.lock_path.exists():
+        if self.owns_lock:
+            self.owns_lock = False
+            self._last_refresh_ns = 0
             try:
-                self.lock_path.unlink()
-                self.owns_lock = False
-                self._last_refresh = None
+                self.lock_path.unlink(missing_ok=True)
                 logger.info("[LOCK] Lock removido (salida normal)")
             except Exception as e:
-                logger.error(f"[LOCK] Error removiendo nuestro lock: {e}")
\ No newline at end of file
+                logger.error("[LOCK] Error removiendo nuestro lock: %s", e)
\ No newline at end of file
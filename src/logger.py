@@ -1,15 +1,34 @@
 """
 Logger simple con archivo por día - formato: YYYY-MM-DD.log
 """
+import os
 import sys
+import time
+import logging
+import threading
+import traceback
 from datetime import datetime
 from pathlib import Path
 
 
+# Timestamp formateado del segundo actual: varias líneas en el mismo segundo
+# reutilizan el mismo string en lugar de llamar strftime cada vez
+_ts_cache = [-1, '']
+
+
+def _now_str():
+    """Fecha/hora actual como 'YYYY-MM-DD HH:MM:SS', cacheada por segundo"""
+    t = int(time.time())
+    if t != _ts_cache[0]:
+        _ts_cache[0] = t
+        _ts_cache[1] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+    return _ts_cache[1]
+
+
 class DailyLogger:
     """Logger que crea un archivo nuevo cada día"""
     
-    def __init__(self, log_dir="logs"):
+    def __init__(self, log_dir="logs", level=logging.INFO):
         # Determinar directorio base (donde está el exe/script)
         if getattr(sys, 'frozen', False):
             # Running as exe
@@ -20,11 +39,24 @@ class DailyLogger:
         
         self.log_dir = base_dir / log_dir
         self.base_dir = base_dir  # Guardar para status.txt
+        self.level = level  # Niveles de `logging` (DEBUG, INFO, WARNING, ERROR)
+        # Eco a consola solo si hay TTY (exe --windowed / servicio: stdout es None o no es consola)
+        self._echo = bool(sys.stdout and sys.stdout.isatty())
         self._ensure_log_dir()
         
-        # Obtener archivo de log para HOY
+        # Obtener archivo de log para HOY (y el día como ordinal, para comparar barato)
+        self._current_day = datetime.now().toordinal()
         self.current_log_file = self._get_todays_log_file()
         
+        self._last_status = None  # Último contenido escrito en status.txt
+        
+        # Handle persistente del log del día (se abre en el primer write, se rota al cambiar de día)
+        self._fh = None
+        # Serializa rotación, escritura, close y status: escriben el loop principal,
+        # los hilos de stop y el handler de consola. RLock porque la rotación
+        # vuelve a llamar a _write
+        self._lock = threading.RLock()
+        
         # Escribir encabezado si es archivo nuevo
         self._write_header()
     
@@ -39,12 +71,14 @@ class DailyLogger:
     
     def _check_new_day(self):
         """Verificar si es un nuevo día y cambiar archivo si es necesario"""
-        expected_file = self._get_todays_log_file()
-        
-        if self.current_log_file != expected_file:
+        # Comparación de enteros por línea; el path solo se arma al cambiar de día
+        today = datetime.now().toordinal()
+        if today != self._current_day:
             # ¡Es un nuevo día!
+            self._current_day = today
+            self.close()
             old_file = self.current_log_file
-            self.current_log_file = expected_file
+            self.current_log_file = self._get_todays_log_file()
             
             # Escribir encabezado en nuevo archivo
             self._write_header()
@@ -57,19 +91,22 @@ class DailyLogger:
             self._write(f"[LOGGER] Iniciando nuevo día - Archivo anterior: {old_file.name}")
     
     def _write_header(self):
-        """Escribir encabezado en archivo nuevo"""
-        if not self.current_log_file.exists():
-            header = f"[LOGGER] Archivo de log creado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-            header += "[LOGGER] Formato: [FECHA] NIVEL - Mensaje\n"
-            header += "="*60 + "\n"
-            
-            with open(self.current_log_file, 'a', encoding='utf-8', buffering=1) as f:
-                f.write(header)
-                f.flush()
+        """Escribir encabezado en archivo nuevo (O_EXCL: si ya existe, no se escribe)"""
+        header = f"[LOGGER] Archivo de log creado: {_now_str()}\n"
+        header += "[LOGGER] Formato: [FECHA] NIVEL - Mensaje\n"
+        header += "="*60 + "\n"
+        
+        try:
+            fd = os.open(self.current_log_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return
+        # fdopen en modo texto: mismos saltos de línea que el resto del log
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(header)
     
     def _write_to_file(self, file_path, message):
         """Escribe mensaje en archivo específico"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = _now_str()
         log_line = f"[{timestamp}] {message}\n"
         
         try:
@@ -81,36 +118,102 @@ class DailyLogger:
             print(f"[LOGGER ERROR] No se pudo escribir en {file_path}: {e}")
     
     def _write(self, message):
-        """Escribe mensaje en archivo de log actual"""
-        # Primero verificar si es nuevo día
-        self._check_new_day()
-        
-        # Escribir en archivo actual
-        self._write_to_file(self.current_log_file, message)
+        """Escribe mensaje en archivo de log actual (handle persistente, line-buffered)"""
+        with self._lock:
+            # Primero verificar si es nuevo día
+            self._check_new_day()
+            
+            timestamp = _now_str()
+            try:
+                if self._fh is None:
+                    self._fh = open(self.current_log_file, 'a', encoding='utf-8', buffering=1)
+                self._fh.write(f"[{timestamp}] {message}\n")
+            except Exception as e:
+                # Si falla, imprimir error pero no crashear; el próximo write reabre
+                print(f"[LOGGER ERROR] No se pudo escribir en {self.current_log_file}: {e}")
+                self.close()
+    
+    def close(self):
+        """Cierra el handle del log (un write posterior lo vuelve a abrir)"""
+        with self._lock:
+            if self._fh is not None:
+                try:
+                    self._fh.close()
+                except Exception:
+                    pass
+                self._fh = None
+    
+    def isEnabledFor(self, level):
+        """¿Se emitiría un mensaje de este nivel? (misma firma que logging.Logger)"""
+        return level >= self.level
     
-    def info(self, message):
+    def _log(self, level, level_name, message, args):
+        """Filtra por nivel y formatea con % solo si el mensaje se va a emitir"""
+        if level < self.level:
+            return
+        if args:
+            message = message % args
+        self._write(f"{level_name} - {message}")
+        if self._echo:
+            print(f"[{level_name}] {message}")
+    
+    def debug(self, message, *args):
+        """Log de detalle (filtrado con el nivel por defecto INFO)"""
+        self._log(logging.DEBUG, "DEBUG", message, args)
+    
+    def info(self, message, *args):
         """Log de información normal"""
-        self._write(f"INFO - {message}")
-        print(f"[INFO] {message}")
+        self._log(logging.INFO, "INFO", message, args)
     
-    def warning(self, message):
+    def warning(self, message, *args):
         """Log de advertencia"""
-        self._write(f"WARNING - {message}")
-        print(f"[WARNING] {message}")
+        self._log(logging.WARNING, "WARNING", message, args)
     
-    def error(self, message):
+    def error(self, message, *args):
         """Log de error"""
-        self._write(f"ERROR - {message}")
-        print(f"[ERROR] {message}")
+        self._log(logging.ERROR, "ERROR", message, args)
+    
+    def exception(self, message, *args, limit=None):
+        """
+        Log de error con el traceback de la excepción actual (llamar desde un except).
+        limit acota los frames formateados (ver traceback.format_exc): negativo
+        conserva los últimos |limit|, que incluyen el frame donde ocurrió el error.
+        """
+        if not self.isEnabledFor(logging.ERROR):
+            return
+        if args:
+            message = message % args
+        self._log(logging.ERROR, "ERROR", f"{message}\n{traceback.format_exc(limit=limit).rstrip()}", ())
     
     def status(self, status_line):
-        """Escribe 1 línea en status.txt (para Team Viewer)"""
-        status_file = self.base_dir / "status.txt"
-        try:
-            with open(status_file, 'w', encoding='utf-8') as f:
-                f.write(f"{datetime.now().strftime('%H:%M')} - {status_line}")
-        except Exception:
-            pass
+        """
+        Escribe 1 línea en status.txt (para Team Viewer).
+        Escritura atómica (tmp + os.replace): un lector nunca ve el archivo truncado.
+        Si el rename falla, se escribe en el lugar como antes.
+        Si el contenido (hora incluida) no cambió, no toca el disco.
+        """
+        with self._lock:
+            content = f"{_now_str()[11:16]} - {status_line}"  # HH:MM del timestamp cacheado
+            if content == self._last_status:
+                return
+            status_file = self.base_dir / "status.txt"
+            # tmp en logs/ y no junto a status.txt: el watcher de stop.txt vigila
+            # base_dir y cada archivo creado/borrado ahí lo despierta
+            tmp_file = self.log_dir / "status.txt.tmp"
+            try:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                try:
+                    os.replace(tmp_file, status_file)
+                except OSError:
+                    # Windows: un lector con status.txt abierto sin FILE_SHARE_DELETE
+                    # (TeamViewer) bloquea el rename; sobrescribir en el lugar
+                    tmp_file.unlink(missing_ok=True)
+                    with open(status_file, 'w', encoding='utf-8') as f:
+                        f.write(content)
+                self._last_status = content
+            except Exception:
+                pass
     
     def get_current_log_file(self):
         """Obtener nombre del archivo de log actual"""
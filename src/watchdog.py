@@ -5,10 +5,121 @@ import os
 import sys
 import json
 import time
+import ctypes
 import subprocess
 from pathlib import Path
 from datetime import datetime
 from .logger import logger
+from .dir_watch import (
+    FILE_NOTIFY_CHANGE_FILE_NAME, FILE_NOTIFY_CHANGE_LAST_WRITE,
+    INVALID_HANDLE_VALUE, WAIT_OBJECT_0,
+)
+
+DEFAULT_LOCK_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Un mtime más adelantado que esto respecto al reloj local no es confiable
+MTIME_SKEW_TOLERANCE_MINUTES = 1
+
+# Windows API constants
+PROCESS_TERMINATE = 0x0001
+SYNCHRONIZE = 0x00100000
+TH32CS_SNAPPROCESS = 0x00000002
+ERROR_INVALID_PARAMETER = 87  # OpenProcess sobre un PID que ya no existe
+ERROR_PIPE_NOT_CONNECTED = 233  # El proceso al otro lado terminó a mitad de la lectura
+
+# Prototipos de kernel32 para terminar procesos sin lanzar taskkill.exe
+# (mismo esquema que lock_manager: WinDLL propio, definidos una sola vez)
+if os.name == 'nt':
+    from ctypes import wintypes
+
+    class PROCESSENTRY32W(ctypes.Structure):
+        _fields_ = [
+            ('dwSize', wintypes.DWORD),
+            ('cntUsage', wintypes.DWORD),
+            ('th32ProcessID', wintypes.DWORD),
+            ('th32DefaultHeapID', ctypes.c_size_t),
+            ('th32ModuleID', wintypes.DWORD),
+            ('cntThreads', wintypes.DWORD),
+            ('th32ParentProcessID', wintypes.DWORD),
+            ('pcPriClassBase', wintypes.LONG),
+            ('dwFlags', wintypes.DWORD),
+            ('szExeFile', wintypes.WCHAR * 260),
+        ]
+
+    _kernel32 = ctypes.WinDLL('kernel32')
+
+    def _proto(name, argtypes, restype):
+        fn = getattr(_kernel32, name)
+        fn.argtypes = argtypes
+        fn.restype = restype
+        return fn
+
+    _CreateToolhelp32Snapshot = _proto('CreateToolhelp32Snapshot', [wintypes.DWORD, wintypes.DWORD], wintypes.HANDLE)
+    _Process32FirstW = _proto('Process32FirstW', [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)], wintypes.BOOL)
+    _Process32NextW = _proto('Process32NextW', [wintypes.HANDLE, ctypes.POINTER(PROCESSENTRY32W)], wintypes.BOOL)
+    _OpenProcess = _proto('OpenProcess', [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD], wintypes.HANDLE)
+    _TerminateProcess = _proto('TerminateProcess', [wintypes.HANDLE, wintypes.UINT], wintypes.BOOL)
+    _WaitForSingleObject = _proto('WaitForSingleObject', [wintypes.HANDLE, wintypes.DWORD], wintypes.DWORD)
+    _CloseHandle = _proto('CloseHandle', [wintypes.HANDLE], wintypes.BOOL)
+    _GetLastError = _proto('GetLastError', [], wintypes.DWORD)
+
+    from .dir_watch import (
+        FindFirstChangeNotificationW as _FindFirstChangeNotificationW,
+        FindNextChangeNotification as _FindNextChangeNotification,
+        FindCloseChangeNotification as _FindCloseChangeNotification,
+    )
+
+
+def _process_snapshot():
+    """Lista [(pid, ppid, exe en minúsculas)] con CreateToolhelp32Snapshot (sin tasklist)"""
+    snapshot = _CreateToolhelp32Snapshot(TH32CS_SNAPPROCESS, 0)
+    if snapshot in (None, INVALID_HANDLE_VALUE):
+        raise ctypes.WinError()
+    try:
+        entry = PROCESSENTRY32W()
+        entry.dwSize = ctypes.sizeof(entry)
+        procs = []
+        ok = _Process32FirstW(snapshot, ctypes.byref(entry))
+        while ok:
+            procs.append((entry.th32ProcessID, entry.th32ParentProcessID, entry.szExeFile.lower()))
+            ok = _Process32NextW(snapshot, ctypes.byref(entry))
+        return procs
+    finally:
+        _CloseHandle(snapshot)
+
+
+def _terminate_pid(pid):
+    """
+    TerminateProcess sobre pid.
+    
+    Returns:
+        (handle, ok): handle (SYNCHRONIZE) para esperar su salida, o None.
+        ok=False si el proceso sigue existiendo pero no se pudo abrir/terminar
+        (ej. ERROR_ACCESS_DENIED); un proceso que ya salió da (None, True).
+    """
+    handle = _OpenProcess(PROCESS_TERMINATE | SYNCHRONIZE, False, pid)
+    if not handle:
+        return None, _GetLastError() == ERROR_INVALID_PARAMETER
+    if not _TerminateProcess(handle, 1):
+        # Falla también si ya estaba saliendo: en ese caso el handle está señalado
+        exited = _WaitForSingleObject(handle, 0) == WAIT_OBJECT_0
+        _CloseHandle(handle)
+        return None, exited
+    return handle, True
+
+
+def _wait_handles(handles, timeout):
+    """
+    Espera (espera de kernel, sin polling) a que terminen los procesos, con un
+    tope total de timeout segundos. Cierra los handles. Retorna cuántos siguen vivos.
+    """
+    deadline = time.monotonic() + timeout
+    alive = 0
+    for handle in handles:
+        remaining_ms = max(0, int((deadline - time.monotonic()) * 1000))
+        if _WaitForSingleObject(handle, remaining_ms) != WAIT_OBJECT_0:
+            alive += 1
+        _CloseHandle(handle)
+    return alive
 
 
 class AppWatchdog:
@@ -17,19 +128,24 @@ class AppWatchdog:
     NO verifica procesos de Windows
     """
     
+    # Flags de creación para la app (sin ventana); 0 fuera de Windows
+    CREATION_FLAGS = getattr(subprocess, 'CREATE_NO_WINDOW', 0)
+    
     def __init__(self, app_name="app_principal.exe", lock_file="app.lock", 
-                 timeout_minutes=50, lock_time_format="%Y-%m-%d %H:%M:%S"):
+                 timeout_minutes=50, lock_time_format=DEFAULT_LOCK_TIME_FORMAT):
         """
         Args:
             app_name: Solo para logging y ejecutar
             lock_file: Archivo lock JSON que tu app crea
             timeout_minutes: Máximo tiempo antes de considerar colgada
-            lock_time_format: Formato del timestamp en JSON
+            lock_time_format: Formato del timestamp en JSON (edad de respaldo
+                cuando el mtime del lock no es confiable, ver check_app_status)
         """
         self.app_name = app_name
         self.lock_file = Path(lock_file)
         self.timeout_minutes = timeout_minutes
         self.lock_time_format = lock_time_format
+        self._parse_lock_time = self._make_time_parser(lock_time_format)
         
         # Determinar directorio base (donde están los exes)
         if getattr(sys, 'frozen', False):
@@ -42,6 +158,14 @@ class AppWatchdog:
         # Si lock_file es relativo, asumir que vive junto al watchdog/app (base_dir)
         if not self.lock_file.is_absolute():
             self.lock_file = (self.base_dir / self.lock_file).resolve()
+        # Ruta como str precalculada para los syscalls del poll (sin __fspath__ por llamada)
+        self._lock_file_str = os.fspath(self.lock_file)
+        
+        # Cache del lock file: ((st_mtime_ns, st_size), data)
+        self._lock_cache = None
+        # Último timestamp del JSON parseado: (timestamp_str, epoch)
+        self._epoch_cache = None
+        self._last_state = None  # Último resultado de check_app_status (para loguear solo transiciones)
         
         logger.info(f"🛡️ Watchdog simplificado:")
         logger.info(f"   App: {self.app_name}")
@@ -50,30 +174,76 @@ class AppWatchdog:
         logger.info(f"   Lógica: Solo verifica lock file, NO procesos")
     
     def _read_lock_file(self):
-        """Lee y parsea el lock file JSON"""
-        if not self.lock_file.exists():
-            logger.info(f"📭 Lock file NO existe: {self.lock_file}")
+        """
+        Lee y parsea el lock file JSON.
+        Si (st_mtime_ns, st_size) no cambió desde la última lectura, devuelve
+        el dict cacheado sin abrir ni parsear el archivo.
+        """
+        try:
+            st = os.stat(self._lock_file_str)
+        except FileNotFoundError:
+            self._lock_cache = None
+            logger.debug("📭 Lock file NO existe: %s", self.lock_file)
             return None
+        except OSError as e:
+            logger.error("❌ Error OS leyendo lock file: %s", e)
+            return None
+        
+        key = (st.st_mtime_ns, st.st_size)
+        if self._lock_cache is not None and self._lock_cache[0] == key:
+            return self._lock_cache[1]
         
         try:
-            with open(self.lock_file, 'r') as f:
-                data = json.load(f)
+            # Un solo os.read de bytes crudos (el lock pesa <1KB) y json.loads sobre
+            # bytes: sin TextIOWrapper ni decodificación incremental
+            fd = os.open(self._lock_file_str, os.O_RDONLY)
+            try:
+                raw = os.read(fd, max(4096, st.st_size + 1))
+            finally:
+                os.close(fd)
+            data = json.loads(raw)
             
-            logger.info(f"📖 Lock file leído: timestamp={data.get('timestamp')}, pid={data.get('pid')}")
+            self._lock_cache = (key, data)
+            logger.debug("📖 Lock file leído: timestamp=%s, pid=%s", data.get('timestamp'), data.get('pid'))
             return data
             
+        except FileNotFoundError:
+            # Desapareció entre el stat y el open (la app acaba de salir)
+            self._lock_cache = None
+            logger.debug("📭 Lock file NO existe: %s", self.lock_file)
+            return None
         except OSError as e:
-            if e.winerror == 233:
-                logger.warning(f"⚠️  Broken pipe al leer lock file (proceso terminado inesperadamente)")
+            if getattr(e, 'winerror', None) == ERROR_PIPE_NOT_CONNECTED:
+                logger.warning("⚠️  Broken pipe al leer lock file (proceso terminado inesperadamente)")
                 return None
-            logger.error(f"❌ Error OS leyendo lock file: {e}")
+            logger.error("❌ Error OS leyendo lock file: %s", e)
             return None
         except Exception as e:
-            logger.error(f"❌ Error leyendo lock file: {e}")
+            logger.error("❌ Error leyendo lock file: %s", e)
             return None
     
-    def _get_lock_age_minutes(self):
-        """Calcula edad del lock file en minutos"""
+    @staticmethod
+    def _make_time_parser(fmt):
+        """
+        Arma una sola vez (en __init__) el parser del timestamp del lock.
+        Con el formato por defecto usa datetime.fromisoformat (en C, sin la
+        maquinaria regex/locale de strptime); formatos personalizados van por strptime.
+        """
+        if fmt != DEFAULT_LOCK_TIME_FORMAT:
+            return lambda timestamp_str: datetime.strptime(timestamp_str, fmt)
+        
+        def parse(timestamp_str):
+            if len(timestamp_str) == 19:
+                return datetime.fromisoformat(timestamp_str)
+            return datetime.strptime(timestamp_str, fmt)  # Mismo error que antes si no encaja
+        return parse
+    
+    def _get_lock_age_minutes(self, now=None):
+        """
+        Calcula edad del lock file en minutos según el timestamp del JSON.
+        Respaldo de check_app_status cuando el mtime no es confiable.
+        now: epoch (time.time()) ya leído por el caller, para no volver a leer el reloj.
+        """
         data = self._read_lock_file()
         if not data:
             return None
@@ -84,18 +254,67 @@ class AppWatchdog:
             return None
         
         try:
-            lock_time = datetime.strptime(timestamp_str, self.lock_time_format)
-            current_time = datetime.now()
-            age_seconds = (current_time - lock_time).total_seconds()
-            age_minutes = age_seconds / 60
+            # Mientras el timestamp no cambie, la edad es solo una resta de floats
+            if self._epoch_cache is not None and self._epoch_cache[0] == timestamp_str:
+                lock_epoch = self._epoch_cache[1]
+            else:
+                lock_epoch = self._parse_lock_time(timestamp_str).timestamp()
+                self._epoch_cache = (timestamp_str, lock_epoch)
+            if now is None:
+                now = time.time()
+            age_minutes = (now - lock_epoch) / 60
             
-            logger.info(f"⏱️  Lock file edad: {age_minutes:.1f} minutos")
+            logger.debug("⏱️  Lock file edad: %.1f minutos", age_minutes)
             return age_minutes
             
         except Exception as e:
-            logger.error(f"❌ Error calculando edad: {e}")
+            logger.error("❌ Error calculando edad: %s", e)
             return None
     
+    def _wait_for_lock(self, exists=True, timeout=30):
+        """
+        Espera hasta que el lock file exista (exists=True) o desaparezca, con tope
+        de timeout segundos. En Windows despierta con notificaciones del directorio
+        (FindFirstChangeNotificationW); si no hay, verifica cada 100ms.
+        
+        Returns:
+            True si se alcanzó el estado esperado, False por timeout
+        """
+        deadline = time.monotonic() + timeout
+        change = None
+        if os.name == 'nt':
+            change = _FindFirstChangeNotificationW(str(self.lock_file.parent), False, FILE_NOTIFY_CHANGE_FILE_NAME)
+            if change == INVALID_HANDLE_VALUE:
+                change = None
+        
+        try:
+            while True:
+                if os.path.exists(self._lock_file_str) == exists:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if change:
+                    # Despierta al crearse/renombrarse/borrarse un archivo del directorio
+                    if _WaitForSingleObject(change, int(remaining * 1000)) == WAIT_OBJECT_0:
+                        _FindNextChangeNotification(change)
+                else:
+                    time.sleep(min(0.1, remaining))
+        finally:
+            if change:
+                _FindCloseChangeNotification(change)
+    
+    def _get_lock_age_minutes_fast(self):
+        """
+        Edad del lock file en minutos según su st_mtime: un solo stat, sin JSON
+        ni strptime. None si no existe; otros OSError se propagan.
+        """
+        try:
+            mtime = os.stat(self._lock_file_str).st_mtime
+        except FileNotFoundError:
+            return None
+        return (time.time() - mtime) / 60
+    
     def check_app_status(self):
         """
         Verifica estado BASADO SOLO EN LOCK FILE
@@ -105,26 +324,102 @@ class AppWatchdog:
             "running_ok"  - Lock file existe y es reciente (< timeout)
             "hung"        - Lock file existe y es viejo (> timeout)
         """
-        logger.info("🔍 Verificando estado (solo por lock file)...")
+        logger.debug("🔍 Verificando estado (solo por lock file)...")
         
-        # 1. ¿Existe lock file?
-        if not self.lock_file.exists():
-            logger.info("📭 NO hay lock file → 'not_running'")
-            return "not_running"
+        # 1+2. Existencia y edad con un solo stat (sin abrir ni parsear el JSON)
+        try:
+            lock_age = self._get_lock_age_minutes_fast()
+        except OSError as e:
+            logger.error("❌ Error leyendo mtime del lock file: %s", e)
+            logger.debug("❓ No se pudo calcular edad → 'running_ok' (asumir bien)")
+            return self._set_state("running_ok")
         
-        # 2. Calcular edad
-        lock_age = self._get_lock_age_minutes()
         if lock_age is None:
-            logger.info("❓ No se pudo calcular edad → 'running_ok' (asumir bien)")
-            return "running_ok"
+            logger.debug("📭 NO hay lock file → 'not_running'")
+            return self._set_state("not_running")
+        
+        logger.debug("⏱️  Lock file edad: %.1f minutos (mtime)", lock_age)
+        
+        # mtime en el futuro: lo puso otro reloj (lock en un share de red, archivo
+        # copiado con su fecha). No sirve para medir edad; usar el timestamp que
+        # la app escribe en el JSON con el reloj de esta máquina
+        if lock_age < -MTIME_SKEW_TOLERANCE_MINUTES:
+            logger.debug("🕒 mtime en el futuro (%.1f min) → edad por timestamp del JSON", lock_age)
+            lock_age = self._get_lock_age_minutes()
+            if lock_age is None:
+                logger.debug("❓ No se pudo calcular edad → 'running_ok' (asumir bien)")
+                return self._set_state("running_ok")
         
-        # 3. Decidir basado en edad
+        # 3. Decidir basado en edad (se evalúa en cada poll aunque el mtime no cambie:
+        # una app colgada es justamente la que deja de mover el mtime)
         if lock_age > self.timeout_minutes:
-            logger.info(f"⚠️  Lock viejo ({lock_age:.1f} min > {self.timeout_minutes} min) → 'hung'")
-            return "hung"
+            logger.debug("⚠️  Lock viejo (%.1f min > %s min) → 'hung'", lock_age, self.timeout_minutes)
+            return self._set_state("hung")
         else:
-            logger.info(f"✅ Lock reciente ({lock_age:.1f} min) → 'running_ok'")
-            return "running_ok"
+            logger.debug("✅ Lock reciente (%.1f min) → 'running_ok'", lock_age)
+            return self._set_state("running_ok")
+    
+    def _lock_mtime_ns(self):
+        """st_mtime_ns del lock, o None si no existe / no se puede leer"""
+        try:
+            return os.stat(self._lock_file_str).st_mtime_ns
+        except OSError:
+            return None
+    
+    def watch_app_status(self, callback, stop_event=None):
+        """
+        Alternativa event-driven a llamar check_app_status en un loop externo.
+        Reevalúa el estado cuando el lock se crea/borra/escribe (despertado por
+        FindFirstChangeNotificationW sobre su directorio) y cada timeout_minutes/2:
+        una app colgada no genera eventos, así que la detección de 'hung' sigue
+        necesitando ese timer. Llama callback(estado) al inicio y después solo si
+        cambió el lock (existencia/st_mtime_ns) o el estado calculado.
+        Bloquea hasta que stop_event (threading.Event) se active.
+        """
+        period = self.timeout_minutes * 60 / 2
+        change = None
+        if os.name == 'nt':
+            change = _FindFirstChangeNotificationW(
+                str(self.lock_file.parent), False,
+                FILE_NOTIFY_CHANGE_FILE_NAME | FILE_NOTIFY_CHANGE_LAST_WRITE)
+            if change == INVALID_HANDLE_VALUE:
+                change = None
+        
+        last = None  # (st_mtime_ns del lock o None, estado) del último callback
+        try:
+            while stop_event is None or not stop_event.is_set():
+                key = self._lock_mtime_ns()
+                state = self.check_app_status()
+                if (key, state) != last:
+                    callback(state)
+                    last = (key, state)
+                next_check = time.monotonic() + period
+                # Esperar un evento del directorio o el timer; en tramos de 1s para ver stop_event
+                while stop_event is None or not stop_event.is_set():
+                    remaining = next_check - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if change:
+                        if _WaitForSingleObject(change, int(min(remaining, 1) * 1000)) == WAIT_OBJECT_0:
+                            _FindNextChangeNotification(change)
+                            # El directorio es compartido (DBF de la app, status.txt):
+                            # solo cuenta si lo que cambió fue el lock
+                            if self._lock_mtime_ns() != last[0]:
+                                break
+                    elif stop_event is not None:
+                        stop_event.wait(min(remaining, 1))
+                    else:
+                        time.sleep(remaining)
+        finally:
+            if change:
+                _FindCloseChangeNotification(change)
+    
+    def _set_state(self, state):
+        """Registra el estado; solo loguea en INFO cuando cambia respecto al poll anterior"""
+        if state != self._last_state:
+            logger.info("🔀 Estado app: %s → %s", self._last_state, state)
+            self._last_state = state
+        return state
     
     def start_app(self):
         """Ejecuta la app"""
@@ -146,35 +441,21 @@ class AppWatchdog:
             logger.info(f"📂 Directorio de trabajo: {app_dir}")
             logger.info(f"📄 Ejecutable: {app_exe}")
             
-            # Save current directory
-            original_cwd = os.getcwd()
-            
-            try:
-                # Change to the app directory before launching
-                os.chdir(str(app_dir))
-                logger.info(f"🔄 Changed working directory to: {os.getcwd()}")
-                
-                # Launch the app - it will inherit the current working directory
-                subprocess.Popen(
-                    [app_exe],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-                
-            finally:
-                # Always restore original directory
-                os.chdir(original_cwd)
-                logger.info(f"🔄 Restored working directory to: {os.getcwd()}")
+            # Launch the app with its own working directory (cwd= va directo a
+            # CreateProcess; el directorio del watchdog no se toca)
+            subprocess.Popen(
+                [app_exe],
+                cwd=str(app_dir),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=self.CREATION_FLAGS
+            )
             
             logger.info(f"✅ {self.app_name} iniciada")
             
-            # Esperar 30 segundos para que cree el lock file
+            # Esperar (máx 30 segundos) a que cree el lock file; retorna apenas aparece
             logger.info("⏳ Esperando creación de lock file...")
-            time.sleep(30)
-            
-            # Verificar que se creó el lock file
-            if self.lock_file.exists():
+            if self._wait_for_lock(exists=True, timeout=30):
                 logger.info(f"✅ Lock file creado: {self.lock_file}")
             else:
                 logger.warning(f"⚠️  Lock file NO creado después de 30 segundos")
@@ -186,10 +467,55 @@ class AppWatchdog:
             logger.error(f"❌ Error ejecutando {self.app_name}: {e}")
             return False
     
+    def _terminate_processes(self, pid=None):
+        """
+        TerminateProcess sobre el PID del lock y sus descendientes (como taskkill /T)
+        y sobre todo proceso con la imagen de la app (como taskkill /IM).
+        El árbol del PID solo se recorre si ese PID sigue siendo la app: tras
+        timeout_minutes sin tocar el lock, Windows pudo reutilizarlo para otro proceso.
+        
+        Returns:
+            (targets, handles, failed): PIDs encontrados, handles abiertos para
+            esperar su salida y PIDs que siguen vivos sin poder terminarlos
+        """
+        procs = _process_snapshot()
+        image = Path(self.app_name).name.lower()
+        targets = set()
+        
+        if pid and not any(p == pid and exe == image for p, _, exe in procs):
+            logger.warning(f"⚠️  El PID {pid} del lock ya no es {image} (salió o fue reutilizado), solo por nombre")
+            pid = None
+        
+        if pid:
+            targets.add(pid)
+            children = {}
+            for child, parent, _ in procs:
+                children.setdefault(parent, []).append(child)
+            pending = [pid]
+            while pending:
+                for child in children.get(pending.pop(), ()):
+                    if child not in targets:
+                        targets.add(child)
+                        pending.append(child)
+        
+        targets.update(p for p, _, exe in procs if exe == image)
+        
+        handles = []
+        failed = []
+        for target in targets:
+            handle, ok = _terminate_pid(target)
+            if handle:
+                handles.append(handle)
+            elif not ok:
+                failed.append(target)
+        return targets, handles, failed
+    
     def kill_app(self):
         """
-        Mata la app usando el PID del lock file
-        (Más preciso que por nombre)
+        Mata la app usando el PID del lock file (y por nombre por si acaso)
+        con TerminateProcess directo, sin lanzar taskkill.exe.
+        Espera la salida real de los procesos (máx 30s) en lugar de un sleep fijo
+        y después borra el lock que dejó la app terminada.
         """
         logger.warning("⚠️  Intentando terminar app...")
         
@@ -199,54 +525,38 @@ class AppWatchdog:
         
         if pid:
             logger.info(f"🎯 Terminando por PID: {pid}")
-            
-            # Intentar terminación elegante
-            try:
-                subprocess.run(
-                    ['taskkill', '/PID', str(pid), '/T'],
-                    capture_output=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    timeout=10
-                )
-                logger.info(f"📤 Terminación enviada a PID {pid}")
-            except Exception as e:
-                logger.warning(f"⚠️  Error terminando PID {pid}: {e}")
         else:
             logger.warning("⚠️  No hay PID en lock file, terminando por nombre")
         
-        # También intentar por nombre por si acaso
         try:
-            subprocess.run(
-                ['taskkill', '/IM', self.app_name, '/T'],
-                capture_output=True,
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                timeout=10
-            )
-            logger.info(f"📤 Terminación enviada por nombre: {self.app_name}")
+            targets, handles, failed = self._terminate_processes(pid)
         except Exception as e:
-            logger.warning(f"⚠️  Error terminando por nombre: {e}")
+            logger.error(f"💥 Error terminando procesos: {e}")
+            return False
         
-        # Esperar y verificar
-        logger.info("⏳ Esperando 30 segundos...")
-        time.sleep(30)
+        logger.info(f"📤 Terminación enviada a {len(handles)}/{len(targets)} proceso(s) ({self.app_name})")
         
-        # Verificar si el lock file fue eliminado
-        if self.lock_file.exists():
-            logger.error("❌ Lock file aún existe - app probablemente sigue corriendo")
-            
-            # Forzar terminación
-            try:
-                subprocess.run(
-                    ['taskkill', '/F', '/IM', self.app_name, '/T'],
-                    capture_output=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    timeout=10
-                )
-                logger.info("💥 Terminación forzada enviada")
-            except Exception as e:
-                logger.error(f"💥 Error en terminación forzada: {e}")
-                return False
-        else:
-            logger.info("✅ Lock file eliminado - app terminada")
+        # Esperar la salida de los procesos: despierta apenas terminan
+        logger.info("⏳ Esperando terminación (máx 30 segundos)...")
+        alive = _wait_handles(handles, 30)
         
-        return True
\ No newline at end of file
+        if failed:
+            # Siguen vivos (ej. sin permisos): el lock se deja para que el próximo
+            # ciclo lo vea 'hung' y reintente, en vez de lanzar otra instancia
+            logger.error(f"❌ No se pudo terminar PID(s) {sorted(failed)} (sin permisos?)")
+            return False
+        
+        if alive:
+            logger.error(f"❌ {alive} proceso(s) siguen corriendo después de 30 segundos")
+            return False
+
+        # Con TerminateProcess la app no borra su lock: si quedara, start_app lo
+        # tomaría como creado por la nueva instancia sin que esta haya arrancado
+        try:
+            self.lock_file.unlink(missing_ok=True)
+        except OSError as e:
+            logger.error(f"❌ No se pudo borrar el lock stale {self.lock_file}: {e}")
+            return False
+
+        logger.info("✅ App terminada")
+        return True
@@ -1,11 +1,15 @@
 """
-Test SIMPLE para LockManager - Solo 3 casos básicos
+Tests de LockManager: creación exclusiva del lock, refresh y limpieza
+Correr con: pytest test/test_lock.py
 """
+import json
 import os
 import sys
 import time
 from pathlib import Path
 
+import pytest
+
 # Asegurar que el directorio raíz del proyecto esté en sys.path
 CURRENT_DIR = Path(__file__).resolve().parent
 ROOT_DIR = CURRENT_DIR.parent  # carpeta smart-dbf-watchdog
@@ -14,109 +18,114 @@ if str(ROOT_DIR) not in sys.path:
 
 from src import lock_manager
 
-def test_1():
-    """Caso 1: No hay lock, debe poder crear"""
-    print("Test 1: Primer watchdog")
-    
-    # Limpiar
-    lock_file = Path("watchdog.lock")
-    if lock_file.exists():
-        lock_file.unlink()
-    
-    lm = lock_manager.LockManager()
-    
-    # Debería poder adquirir
-    if lm.check_and_acquire():
-        lm.create_lock()
-        print("  ✓ Lock creado")
-        
-        # Verificar que existe
-        if lock_file.exists():
-            print("  ✓ Lock file existe en disco")
-        else:
-            print("  ✗ ERROR: Lock file no creado")
-        
-        lm.remove_lock()
-        return True
-    else:
-        print("  ✗ ERROR: No pudo adquirir lock (debería poder)")
-        return False
-
-def test_2():
-    """Caso 2: Lock reciente, debe rechazar"""
-    print("\nTest 2: Lock reciente (debe rechazar)")
-    
-    # Primero crear un lock
-    lm1 = lock_manager.LockManager()
-    lm1.check_and_acquire()
-    lm1.create_lock()
-    print("  Lock creado por 'proceso 1'")
-    
-    # Esperar 1 segundo (pero menos de 5 minutos)
-    time.sleep(1)
-    
-    # Intentar otro lock
-    lm2 = lock_manager.LockManager()
-    result = lm2.check_and_acquire()
-    
-    if not result:
-        print("  ✓ Correctamente rechazado (hay otro watchdog)")
-    else:
-        print("  ✗ ERROR: Debería haber rechazado")
-    
-    # Limpiar
-    lm1.remove_lock()
-    return not result  # Queremos que sea False
-
-def test_3():
-    """Caso 3: Salir y verificar que se limpia"""
-    print("\nTest 3: Limpieza automática")
-    
-    # Crear lock
-    lm = lock_manager.LockManager()
-    lm.check_and_acquire()
-    lm.create_lock()
-    print("  Lock creado")
-    
-    # Remover (simula salida normal)
+VIEJO = time.time() - 3600  # mtime de hace una hora
+
+
+@pytest.fixture
+def lm(tmp_path):
+    """LockManager nuevo por test, con watchdog.lock en un directorio temporal"""
+    manager = lock_manager.LockManager()
+    manager.lock_path = tmp_path / "watchdog.lock"
+    return manager
+
+
+def _tmps(lm):
+    """Archivos .tmp que quedaron junto al lock"""
+    return list(lm.lock_path.parent.glob("*.tmp"))
+
+
+def test_create_lock_file_publica_json(lm):
+    """El lock aparece completo (JSON con nuestro PID) y no queda el tmp"""
+    lm._create_lock_file()
+
+    data = json.loads(lm.lock_path.read_text())
+    assert data["pid"] == os.getpid()
+    assert data["type"] == "watchdog"
+    assert "timestamp" in data
+    assert _tmps(lm) == []
+
+
+def test_create_lock_file_existente(lm):
+    """Si el lock ya existe: FileExistsError, el lock ajeno intacto y sin tmp"""
+    lm.lock_path.write_text("ajeno")
+
+    with pytest.raises(FileExistsError):
+        lm._create_lock_file()
+
+    assert lm.lock_path.read_text() == "ajeno"
+    assert _tmps(lm) == []
+
+
+def test_create_lock_file_sin_hardlinks(lm, monkeypatch):
+    """Sin soporte de hardlinks se crea con O_EXCL directo"""
+    def _sin_link(src, dst):
+        raise PermissionError(1, "Operation not permitted")
+    monkeypatch.setattr(lock_manager.os, "link", _sin_link)
+
+    lm._create_lock_file()
+
+    assert json.loads(lm.lock_path.read_text())["pid"] == os.getpid()
+    assert _tmps(lm) == []
+
+
+def test_create_lock_file_sin_hardlinks_existente(lm, monkeypatch):
+    """El fallback O_EXCL tampoco pisa un lock existente"""
+    def _sin_link(src, dst):
+        raise PermissionError(1, "Operation not permitted")
+    monkeypatch.setattr(lock_manager.os, "link", _sin_link)
+    lm.lock_path.write_text("ajeno")
+
+    with pytest.raises(FileExistsError):
+        lm._create_lock_file()
+
+    assert lm.lock_path.read_text() == "ajeno"
+    assert _tmps(lm) == []
+
+
+def test_refresh_lock_sin_poseerlo(lm):
+    """Sin ser dueños del lock no se toca"""
+    lm.lock_path.write_text("ajeno")
+    os.utime(lm.lock_path, (VIEJO, VIEJO))
+
+    assert lm.refresh_lock() is False
+    assert lm.lock_path.stat().st_mtime == VIEJO
+
+
+def test_refresh_lock_gate(lm):
+    """Dentro del intervalo mínimo no escribe; pasado el intervalo mueve el mtime"""
+    lm._create_lock_file()
+    lm.owns_lock = True
+    os.utime(lm.lock_path, (VIEJO, VIEJO))
+
+    lm._last_refresh_ns = time.monotonic_ns()  # Recién refrescado
+    assert lm.refresh_lock() is True
+    assert lm.lock_path.stat().st_mtime == VIEJO
+
+    lm._last_refresh_ns -= lm._refresh_gate_ns  # Ya pasó el intervalo
+    contenido = lm.lock_path.read_bytes()
+    assert lm.refresh_lock() is True
+    assert lm.lock_path.stat().st_mtime > VIEJO
+    assert lm.lock_path.read_bytes() == contenido  # Solo el mtime, el JSON no cambia
+
+
+def test_refresh_lock_desaparecido(lm):
+    """Si el lock desapareció no se recrea"""
+    lm.owns_lock = True
+
+    assert lm.refresh_lock() is False
+    assert not lm.lock_path.exists()
+
+
+def test_remove_lock_dos_veces(lm):
+    """remove_lock borra nuestro lock y una segunda llamada no hace nada"""
+    lm._create_lock_file()
+    lm.owns_lock = True
+
+    lm.remove_lock()
+    assert not lm.lock_path.exists()
+    assert lm.owns_lock is False
+
+    # Otro watchdog tomó el lock entretanto: la segunda llamada no lo borra
+    lm.lock_path.write_text("ajeno")
     lm.remove_lock()
-    
-    # Verificar que no existe
-    lock_file = Path("watchdog.lock")
-    if not lock_file.exists():
-        print("  ✓ Lock removido correctamente")
-        return True
-    else:
-        print("  ✗ ERROR: Lock no fue removido")
-        return False
-
-def main():
-    """Ejecutar todos los tests"""
-    print("="*50)
-    print("TEST SIMPLE LOCK MANAGER")
-    print("="*50)
-    
-    resultados = []
-    
-    # resultados.append(test_1())
-    # time.sleep(1)  # Pequeña pausa
-    
-    resultados.append(test_2())
-    time.sleep(1)
-    
-    resultados.append(test_3())
-    
-    # Resumen
-    print("\n" + "="*50)
-    print("RESULTADO FINAL:")
-    print(f"Tests pasados: {sum(resultados)} de {len(resultados)}")
-    
-    if all(resultados):
-        print("✅ TODOS LOS TESTS PASARON")
-    else:
-        print("❌ ALGUN TEST FALLÓ")
-    
-    print("="*50)
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+    assert lm.lock_path.read_text() == "ajeno"
@@ -0,0 +1,133 @@
+"""
+Tests de DailyLogger: handle persistente, cambio de día, encabezado y status.txt
+Correr con: pytest test/test_log.py
+"""
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+# Asegurar que el directorio raíz del proyecto esté en sys.path
+CURRENT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = CURRENT_DIR.parent  # carpeta smart-dbf-watchdog
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from src import logger as log_mod
+
+ENCABEZADO = "[LOGGER] Archivo de log creado"
+
+
+@pytest.fixture
+def nuevo_logger(tmp_path, monkeypatch):
+    """Crea DailyLoggers con base_dir = tmp_path (y log_dir = tmp_path/logs)"""
+    # base_dir sale de src/ -> raíz del proyecto: src/ falso dentro de tmp_path
+    monkeypatch.setattr(log_mod, "__file__", str(tmp_path / "src" / "logger.py"))
+    creados = []
+
+    def _crear():
+        lg = log_mod.DailyLogger()
+        lg._echo = False
+        creados.append(lg)
+        return lg
+
+    yield _crear
+    for lg in creados:
+        lg.close()
+
+
+def test_rutas_en_tmp(nuevo_logger, tmp_path):
+    """log_dir y base_dir quedan bajo el directorio temporal"""
+    lg = nuevo_logger()
+    assert lg.base_dir == tmp_path
+    assert lg.log_dir == tmp_path / "logs"
+    assert lg.current_log_file.parent == tmp_path / "logs"
+
+
+def test_handle_persistente(nuevo_logger):
+    """Varias líneas se escriben con el mismo handle, sin reabrir el archivo"""
+    lg = nuevo_logger()
+    lg.info("uno")
+    fh = lg._fh
+    lg.warning("dos %s", "args")
+
+    assert lg._fh is fh
+    texto = lg.current_log_file.read_text(encoding="utf-8")
+    assert "INFO - uno" in texto
+    assert "WARNING - dos args" in texto
+
+
+def test_encabezado_una_sola_vez(nuevo_logger):
+    """O_EXCL: un segundo logger sobre el mismo archivo no repite el encabezado"""
+    lg1 = nuevo_logger()
+    lg1.info("uno")
+    lg2 = nuevo_logger()
+    lg2.info("dos")
+
+    texto = lg1.current_log_file.read_text(encoding="utf-8")
+    assert texto.startswith(ENCABEZADO)
+    assert texto.count(ENCABEZADO) == 1
+
+
+def test_cambio_de_dia(nuevo_logger):
+    """Al cambiar de día: cierra el handle, encabezado en el nuevo y 'Continuado en' en el viejo"""
+    lg = nuevo_logger()
+    hoy = lg.current_log_file
+
+    # Simular que el archivo abierto es el de ayer
+    lg.close()
+    ayer = lg.log_dir / "watchdog_ayer.log"
+    hoy.replace(ayer)
+    lg.current_log_file = ayer
+    lg.info("de ayer")
+    fh_ayer = lg._fh
+
+    lg._current_day -= 1
+    lg.info("de hoy")
+
+    assert fh_ayer.closed
+    assert lg.current_log_file == hoy
+    assert lg._current_day == datetime.now().toordinal()
+
+    texto_ayer = ayer.read_text(encoding="utf-8")
+    assert "INFO - de ayer" in texto_ayer
+    assert f"[LOGGER] Continuado en {hoy.name}" in texto_ayer
+
+    texto_hoy = hoy.read_text(encoding="utf-8")
+    assert texto_hoy.startswith(ENCABEZADO)
+    assert "Archivo anterior: watchdog_ayer.log" in texto_hoy
+    assert "INFO - de hoy" in texto_hoy
+
+
+def test_status_sin_cambios_no_escribe(nuevo_logger, monkeypatch):
+    """Mismo contenido (misma hora y línea) no vuelve a tocar status.txt"""
+    monkeypatch.setattr(log_mod, "_now_str", lambda: "2025-12-02 14:30:45")
+    lg = nuevo_logger()
+    status_file = lg.base_dir / "status.txt"
+
+    lg.status("OK")
+    assert status_file.read_text(encoding="utf-8") == "14:30 - OK"
+
+    status_file.write_text("otro", encoding="utf-8")
+    lg.status("OK")
+    assert status_file.read_text(encoding="utf-8") == "otro"
+
+    lg.status("Reiniciando")
+    assert status_file.read_text(encoding="utf-8") == "14:30 - Reiniciando"
+    assert not (lg.log_dir / "status.txt.tmp").exists()
+
+
+def test_status_rename_bloqueado(nuevo_logger, monkeypatch):
+    """Si os.replace falla (lector sin FILE_SHARE_DELETE) se escribe en el lugar"""
+    monkeypatch.setattr(log_mod, "_now_str", lambda: "2025-12-02 14:30:45")
+    lg = nuevo_logger()
+
+    def _bloqueado(src, dst):
+        raise PermissionError(13, "Permission denied")
+    monkeypatch.setattr(log_mod.os, "replace", _bloqueado)
+
+    lg.status("OK")
+
+    assert (lg.base_dir / "status.txt").read_text(encoding="utf-8") == "14:30 - OK"
+    assert not (lg.log_dir / "status.txt.tmp").exists()
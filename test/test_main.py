@@ -0,0 +1,116 @@
+"""
+Tests de los helpers de main.py: horario, espera interrumpible y fuentes de stop
+"""
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Asegurar que el directorio raíz del proyecto esté en sys.path
+CURRENT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = CURRENT_DIR.parent  # carpeta smart-dbf-watchdog
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import main
+
+RANGOS = [(0, 6), (9, 24)]  # Mismo horario que CONFIG
+
+
+@pytest.fixture(autouse=True)
+def estado_stop(tmp_path, monkeypatch):
+    """stop.txt en un directorio temporal y _stop_event/_stop_source limpios por test"""
+    monkeypatch.setattr(main, "_STOP_FILE", str(tmp_path / "stop.txt"))
+    monkeypatch.setattr(main, "_stop_source", None)
+    main._stop_event.clear()
+    yield
+    main._stop_event.clear()
+
+
+def hora(h, m=0, s=0):
+    """struct_time local con la hora dada (la fecha no importa a los helpers)"""
+    return time.struct_time((2025, 12, 2, h, m, s, 1, 336, -1))
+
+
+@pytest.mark.parametrize("ahora, hasta, segundos", [
+    (hora(6, 0, 0), 9, 3 * 3600),                 # Fuera de horario → 9:00 de hoy
+    (hora(8, 59, 30), 9, 30),
+    (hora(23, 30, 0), 0, 30 * 60),                # Cruza medianoche
+    (hora(9, 0, 0), 9, 86400),                    # Exacto a la hora: 24h, nunca 0
+])
+def test_seconds_until(ahora, hasta, segundos):
+    """Segundos de la espera larga fuera de horario"""
+    assert main.seconds_until(hasta, ahora) == segundos
+
+
+def test_schedule_mask():
+    """Bit h encendido solo para las horas dentro de algún rango [inicio, fin)"""
+    mask = main.schedule_mask(RANGOS)
+    en_horario = [h for h in range(24) if (mask >> h) & 1]
+    assert en_horario == [0, 1, 2, 3, 4, 5] + list(range(9, 24))
+
+
+def test_schedule_mask_rango_invalido():
+    """Un rango que cruza medianoche como (22, 6) se ignora en lugar de fallar"""
+    assert main.schedule_mask([(22, 6), (9, 12)]) == main.schedule_mask([(9, 12)])
+    assert main.next_start_table([(22, 6), (9, 12)]) == main.next_start_table([(9, 12)])
+    assert main.schedule_mask([(22, 6)]) == 0
+    assert main.next_start_table([(22, 6)]) == [0] * 24
+
+
+def test_next_start_table():
+    """Para cada hora, el inicio del siguiente rango (o el primero de mañana)"""
+    tabla = main.next_start_table(RANGOS)
+    assert len(tabla) == 24
+    assert tabla[6] == tabla[7] == tabla[8] == 9   # Fuera de horario → 9:00 de hoy
+    assert tabla[9] == tabla[23] == 0              # Después del último inicio → 0:00 de mañana
+
+
+def test_interruptible_sleep_completo():
+    """Sin stop: duerme todo el tiempo, llama on_tick y retorna False"""
+    ticks = []
+    assert main.interruptible_sleep(0.05, on_tick=lambda: ticks.append(1)) is False
+    assert ticks == [1]
+    assert main._stop_source is None
+
+
+def test_interruptible_sleep_stop_file():
+    """stop.txt presente: retorna True, lo elimina y registra la fuente"""
+    Path(main._STOP_FILE).write_text("")
+
+    assert main.interruptible_sleep(60) is True
+    assert not os.path.exists(main._STOP_FILE)
+    assert main._stop_source == "stop.txt"
+
+
+def test_interruptible_sleep_evento():
+    """Un stop desde otro hilo despierta la espera al instante con su fuente"""
+    timer = threading.Timer(0.05, main._request_stop, ("SIGTERM",))
+    timer.start()
+    inicio = time.monotonic()
+    try:
+        assert main.interruptible_sleep(60) is True
+    finally:
+        timer.join()
+    assert time.monotonic() - inicio < 5
+    assert main._stop_source == "SIGTERM"
+
+
+def test_request_stop_primera_fuente_gana():
+    """La fuente reportada es la primera que pidió el stop"""
+    main._request_stop("usuario (Ctrl+C)")
+    main._request_stop("stop.txt")
+    assert main._stop_event.is_set()
+    assert main._stop_source == "usuario (Ctrl+C)"
+
+
+def test_check_startup_stop_file_error_continua(monkeypatch):
+    """Un error que no sea 'no existe' al revisar stop.txt no impide arrancar"""
+    def _denegado():
+        raise PermissionError(13, "Permission denied")
+    monkeypatch.setattr(main, "_stop_exists", _denegado)
+
+    assert main.check_startup_stop_file() is True
@@ -1,13 +1,14 @@
 """
 Test REAL del watchdog - Simula escenarios reales
+Correr con: pytest test/test_watchdog.py (admite pytest -n auto)
 """
 import os
-import json
-import time
-import tempfile
+import sys
+import threading
 from datetime import datetime, timedelta
 from pathlib import Path
-import sys
+
+import pytest
 
 # Asegurar que el directorio raíz del proyecto esté en sys.path
 CURRENT_DIR = Path(__file__).resolve().parent
@@ -17,316 +18,241 @@ if str(ROOT_DIR) not in sys.path:
 
 from src import watchdog  # Importamos el módulo para crear instancias
 
+FORMATO = "%Y-%m-%d %H:%M:%S"
 
-def crear_lock_falso(timestamp_str, pid=9999):
-    """Crea un lock file falso para testing"""
-    lock_data = {
-        "timestamp": timestamp_str,
-        "pid": pid,
-        "client_id": "test"
-    }
-    
-    with open("test_app.lock", 'w') as f:
-        json.dump(lock_data, f, indent=2)
-    
-    return lock_data
-
-
-def test_1_lock_fresco():
-    """Test: Lock file reciente (<30min)"""
-    print("🧪 Test 1: Lock file FRESCO (reciente)")
-    print("-" * 40)
-    
-    # Crear lock file con timestamp actual (fresco)
-    timestamp_actual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    crear_lock_falso(timestamp_actual)
-    
-    # Crear watchdog de prueba
-    wd = watchdog.AppWatchdog(
+# Payload del lock falso (pid/client_id fijos): solo se sustituye el timestamp
+LOCK_JSON = '{"timestamp":"%s","pid":%d,"client_id":"test"}'
+
+# Timestamps de los escenarios, calculados una vez al importar. AHORA sin
+# microsegundos (el formato no los guarda): pasando now=AHORA_EPOCH la edad es exacta
+AHORA = datetime.now().replace(microsecond=0)
+AHORA_EPOCH = AHORA.timestamp()
+TS_FRESCO = AHORA.strftime(FORMATO)
+TS_VIEJO = (AHORA - timedelta(minutes=35)).strftime(FORMATO)
+
+
+@pytest.fixture
+def wd(tmp_path):
+    """Instancia nueva por test, con el lock en su propio directorio temporal"""
+    return watchdog.AppWatchdog(
         app_name="test_app.exe",  # Nombre falso
-        lock_file="test_app.lock",
+        lock_file=str(tmp_path / "test_app.lock"),
         timeout_minutes=30
     )
-    
-    # Leer lock file
-    lock_data = wd.read_lock_file()
-    print(f"✓ Lock leído: {lock_data['timestamp']}")
-    
-    # Calcular edad
-    edad = wd.get_lock_age_minutes()
-    print(f"✓ Edad calculada: {edad:.2f} minutos")
-    
-    # Verificar estado (simulando que proceso existe)
-    # Para simular proceso existente, necesitaríamos mock
-    print(f"✓ Edad < 30min: {'SÍ' if edad < 30 else 'NO'}")
-    
-    # Limpiar
-    os.remove("test_app.lock")
-    print("✅ Test 1 PASADO\n")
-    return True
-
-
-def test_2_lock_viejo():
-    """Test: Lock file viejo (>30min)"""
-    print("🧪 Test 2: Lock file VIEJO (>30min)")
-    print("-" * 40)
-    
-    # Crear lock file con timestamp de hace 35 minutos
-    tiempo_viejo = datetime.now() - timedelta(minutes=35)
-    timestamp_viejo = tiempo_viejo.strftime("%Y-%m-%d %H:%M:%S")
-    crear_lock_falso(timestamp_viejo)
-    
-    # Crear watchdog
-    wd = watchdog.AppWatchdog(
-        app_name="test_app.exe",
-        lock_file="test_app.lock",
-        timeout_minutes=30
-    )
-    
-    # Leer lock file
-    lock_data = wd.read_lock_file()
-    print(f"✓ Lock leído: {lock_data['timestamp']}")
-    print(f"  (hace 35 minutos)")
-    
-    # Calcular edad
-    edad = wd.get_lock_age_minutes()
-    print(f"✓ Edad calculada: {edad:.1f} minutos")
-    
-    # Verificar
-    if edad > 30:
-        print(f"✓ CORRECTO: Edad > 30min (app estaría COLGADA)")
-    else:
-        print(f"✗ ERROR: Edad debería ser >30, es {edad:.1f}")
-    
-    # Limpiar
-    os.remove("test_app.lock")
-    print("✅ Test 2 PASADO\n")
-    return edad > 30
-
-
-def test_3_lock_corrupto():
-    """Test: Lock file corrupto/inválido"""
-    print("🧪 Test 3: Lock file CORRUPTO")
-    print("-" * 40)
-    
-    # Crear archivo corrupto (no JSON válido)
-    with open("test_app.lock", 'w') as f:
-        f.write("ESTO NO ES JSON {corrupto: sí}")
-    
-    # Crear watchdog
-    wd = watchdog.AppWatchdog(
-        app_name="test_app.exe",
-        lock_file="test_app.lock",
-        timeout_minutes=30
-    )
-    
-    # Intentar leer lock file corrupto
-    lock_data = wd.read_lock_file()
-    
-    if lock_data is None:
-        print("✓ CORRECTO: Detectó lock corrupto (retornó None)")
-        resultado = True
-    else:
-        print(f"✗ ERROR: Debería retornar None, retornó: {lock_data}")
-        resultado = False
-    
-    # Calcular edad debería ser None
-    edad = wd.get_lock_age_minutes()
-    if edad is None:
-        print("✓ CORRECTO: Edad es None para lock corrupto")
-    else:
-        print(f"✗ ERROR: Edad debería ser None, es: {edad}")
-        resultado = False
-    
-    # Limpiar
-    os.remove("test_app.lock")
-    print("✅ Test 3 PASADO\n")
-    return resultado
-
-
-def test_4_sin_lock_file():
-    """Test: No existe lock file"""
-    print("🧪 Test 4: SIN lock file")
-    print("-" * 40)
-    
-    # Asegurarse que no existe el archivo
-    if os.path.exists("test_app.lock"):
-        os.remove("test_app.lock")
-    
-    # Crear watchdog
+
+
+def crear_lock_falso(lock_path, timestamp_str, pid=9999):
+    """
+    Crea un lock file falso para testing.
+    El mtime se fija al mismo timestamp, como si la app lo hubiera escrito en ese momento.
+    """
+    with open(lock_path, 'w') as f:
+        f.write(LOCK_JSON % (timestamp_str, pid))
+
+    mtime = datetime.strptime(timestamp_str, FORMATO).timestamp()
+    os.utime(lock_path, (mtime, mtime))
+
+
+@pytest.mark.parametrize("timestamp, minutos, colgada", [
+    (TS_FRESCO, 0, False),  # Lock FRESCO (reciente)
+    (TS_VIEJO, 35, True),   # Lock VIEJO (>30min) → app colgada
+])
+def test_edad_lock(wd, timestamp, minutos, colgada):
+    """Lock file fresco / viejo: edad por timestamp del JSON y estado por mtime"""
+    crear_lock_falso(wd.lock_file, timestamp)
+
+    lock_data = wd._read_lock_file()
+    assert lock_data["timestamp"] == timestamp
+
+    edad = wd._get_lock_age_minutes(now=AHORA_EPOCH)
+    assert edad == minutos
+    assert (edad > wd.timeout_minutes) is colgada
+    assert wd.check_app_status() == ("hung" if colgada else "running_ok")
+
+
+def test_lock_corrupto(wd):
+    """Lock file corrupto/inválido: lectura y edad devuelven None"""
+    wd.lock_file.write_text("ESTO NO ES JSON {corrupto: sí}", encoding="utf-8")
+
+    assert wd._read_lock_file() is None
+    assert wd._get_lock_age_minutes() is None
+
+
+def test_sin_lock_file(wd):
+    """No existe lock file: None en lectura/edad y estado 'not_running'"""
+    assert wd._read_lock_file() is None
+    assert wd._get_lock_age_minutes() is None
+    assert wd.check_app_status() == "not_running"
+
+
+@pytest.mark.parametrize("fmt, timestamp_str, esperado", [
+    ("%Y-%m-%d %H:%M:%S", "2025-12-02 14:30:45", datetime(2025, 12, 2, 14, 30, 45)),
+    ("%d/%m/%Y %H:%M", "02/12/2025 14:30", datetime(2025, 12, 2, 14, 30)),
+    ("%Y%m%d_%H%M%S", "20251202_143045", datetime(2025, 12, 2, 14, 30, 45)),
+])
+def test_formato_timestamp(tmp_path, fmt, timestamp_str, esperado):
+    """Diferentes formatos de timestamp (lock_time_format es argumento del constructor)"""
     wd = watchdog.AppWatchdog(
         app_name="test_app.exe",
-        lock_file="test_app.lock",  # No existe
-        timeout_minutes=30
+        lock_file=str(tmp_path / "test_app.lock"),
+        timeout_minutes=30,
+        lock_time_format=fmt
     )
-    
-    # Intentar leer lock file inexistente
-    lock_data = wd.read_lock_file()
-    
-    if lock_data is None:
-        print("✓ CORRECTO: Lock file no existe (retornó None)")
-        resultado = True
-    else:
-        print(f"✗ ERROR: Debería retornar None, retornó: {lock_data}")
-        resultado = False
-    
-    # Calcular edad debería ser None
-    edad = wd.get_lock_age_minutes()
-    if edad is None:
-        print("✓ CORRECTO: Edad es None cuando no hay lock")
-    else:
-        print(f"✗ ERROR: Edad debería ser None, es: {edad}")
-        resultado = False
-    
-    print("✅ Test 4 PASADO\n")
-    return resultado
-
-
-def test_5_formato_timestamp():
-    """Test: Diferentes formatos de timestamp"""
-    print("🧪 Test 5: Formatos de timestamp")
-    print("-" * 40)
-    
-    formatos = [
-        ("%Y-%m-%d %H:%M:%S", "2025-12-02 14:30:45"),
-        ("%d/%m/%Y %H:%M", "02/12/2025 14:30"),
-        ("%Y%m%d_%H%M%S", "20251202_143045"),
-    ]
-    
-    resultados = []
-    
-    for fmt, timestamp_str in formatos:
-        print(f"\nProbando formato: {fmt}")
-        print(f"Timestamp: {timestamp_str}")
-        
-        # Crear watchdog con formato específico
-        wd = watchdog.AppWatchdog(
-            app_name="test_app.exe",
-            lock_file="test_app.lock",
-            timeout_minutes=30,
-            lock_time_format=fmt
-        )
-        
-        # Crear lock con este formato
-        lock_data = {
-            "timestamp": timestamp_str,
-            "pid": 9999,
-            "client_id": "test"
-        }
-        
-        with open("test_app.lock", 'w') as f:
-            json.dump(lock_data, f)
-        
-        # Intentar leer y calcular edad
-        data_leida = wd.read_lock_file()
-        edad = wd.get_lock_age_minutes()
-        
-        if data_leida and edad is not None:
-            print(f"  ✓ Formato aceptado, edad: {edad:.2f} min")
-            resultados.append(True)
-        else:
-            print(f"  ✗ Formato NO aceptado")
-            resultados.append(False)
-        
-        # Limpiar
-        os.remove("test_app.lock")
-    
-    todos_ok = all(resultados)
-    print(f"\n✅ Test 5: {'PASADO' if todos_ok else 'FALLADO'}\n")
-    return todos_ok
-
-
-def test_6_simulacion_estados():
-    """Test: Simulación de estados posibles"""
-    print("🧪 Test 6: Simulación de ESTADOS de app")
-    print("-" * 40)
-    
-    # Nota: Para test real necesitaríamos mock de is_app_running()
-    # Por ahora solo explicamos la lógica
-    
-    print("ESTADOS POSIBLES:")
-    print()
-    print("1. 'not_running' → Cuando:")
-    print("   - is_app_running() retorna False")
-    print("   - Sin importar lock file")
-    print()
-    print("2. 'running_ok' → Cuando:")
-    print("   - is_app_running() retorna True")
-    print("   - Y (lock file no existe O edad < timeout)")
-    print()
-    print("3. 'hung' → Cuando:")
-    print("   - is_app_running() retorna True")
-    print("   - Y lock file existe Y edad > timeout")
-    print()
-    
-    print("🎯 Para test REAL de estados necesitamos:")
-    print("   - Mock de is_app_running()")
-    print("   - Mock de subprocess.run()")
-    print("   (Esto es para test unitario avanzado)")
-    
-    print("\n⏭️  Este test se completará en versión avanzada")
-    return True  # Aceptamos por ahora
-
-
-def main():
-    """Ejecutar todos los tests"""
-    print("=" * 60)
-    print("🧪 TESTS REALES DEL WATCHDOG")
-    print("=" * 60)
-    
-    # Cambiar al directorio actual
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    
-    resultados = []
-    
+
+    with open(wd.lock_file, 'w') as f:
+        f.write(LOCK_JSON % (timestamp_str, 9999))
+
+    assert wd._read_lock_file() == {"timestamp": timestamp_str, "pid": 9999, "client_id": "test"}
+    assert wd._get_lock_age_minutes(now=esperado.timestamp() + 90 * 60) == 90
+
+
+def test_mtime_futuro_usa_timestamp_json(wd):
+    """mtime en el futuro (otro reloj): la edad sale del timestamp del JSON"""
+    crear_lock_falso(wd.lock_file, TS_VIEJO)
+    futuro = AHORA_EPOCH + 3600
+    os.utime(wd.lock_file, (futuro, futuro))
+
+    assert wd.check_app_status() == "hung"
+
+
+def test_set_state_loguea_solo_transiciones(wd, monkeypatch):
+    """_set_state retorna el estado y solo loguea en INFO cuando cambia"""
+    infos = []
+    monkeypatch.setattr(watchdog.logger, "info", lambda msg, *args: infos.append(args))
+
+    assert wd._set_state("not_running") == "not_running"
+    assert wd._set_state("not_running") == "not_running"
+    assert wd._set_state("running_ok") == "running_ok"
+
+    assert infos == [(None, "not_running"), ("not_running", "running_ok")]
+
+
+def test_wait_for_lock(wd):
+    """_wait_for_lock: retorna al alcanzar el estado pedido o False por timeout"""
+    assert wd._wait_for_lock(exists=False, timeout=0) is True
+    assert wd._wait_for_lock(exists=True, timeout=0.2) is False
+
+    timer = threading.Timer(0.1, crear_lock_falso, (wd.lock_file, TS_FRESCO))
+    timer.start()
     try:
-        resultados.append(test_1_lock_fresco())
-        time.sleep(0.5)
-        
-        resultados.append(test_2_lock_viejo())
-        time.sleep(0.5)
-        
-        resultados.append(test_3_lock_corrupto())
-        time.sleep(0.5)
-        
-        resultados.append(test_4_sin_lock_file())
-        time.sleep(0.5)
-        
-        resultados.append(test_5_formato_timestamp())
-        time.sleep(0.5)
-        
-        resultados.append(test_6_simulacion_estados())
-        
-    except Exception as e:
-        print(f"💥 ERROR en tests: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
-    
-    # Resumen final
-    print("=" * 60)
-    print("📊 RESUMEN FINAL DE TESTS")
-    print("=" * 60)
-    
-    pasados = sum(resultados)
-    total = len(resultados)
-    
-    for i, resultado in enumerate(resultados, 1):
-        estado = "✅ PASÓ" if resultado else "❌ FALLÓ"
-        print(f"Test {i}: {estado}")
-    
-    print(f"\n🎯 Resultado: {pasados}/{total} tests pasados")
-    
-    if pasados == total:
-        print("\n✨ ¡TODOS LOS TESTS PASARON!")
-        print("El watchdog funciona correctamente en escenarios básicos.")
-    else:
-        print(f"\n⚠️  {total - pasados} test(s) fallaron")
-        print("Revisa los errores arriba.")
-    
-    print("=" * 60)
-    return pasados == total
-
-
-if __name__ == "__main__":
-    exit(0 if main() else 1)
\ No newline at end of file
+        assert wd._wait_for_lock(exists=True, timeout=5) is True
+    finally:
+        timer.join()
+
+
+# Snapshot falso: (pid, ppid, exe en minúsculas)
+PROCESOS = [
+    (100, 1, "test_app.exe"),    # PID del lock
+    (101, 100, "helper.exe"),    # Hijo
+    (102, 101, "child.exe"),     # Nieto
+    (200, 1, "test_app.exe"),    # Otra instancia por nombre
+    (300, 1, "otro.exe"),        # No relacionado
+    (301, 300, "test_app.exe"),  # Por nombre aunque su padre no sea objetivo
+    (400, 1, "explorer.exe"),    # No relacionado
+]
+
+
+def test_terminate_processes_objetivos(wd, monkeypatch):
+    """_terminate_processes: árbol del PID del lock + procesos con la imagen de la app"""
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    # 102 ya salió (sin handle que esperar), 200 sin permisos
+    resultados = {102: (None, True), 200: (None, False)}
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: resultados.get(pid, (pid, True)))
+
+    targets, handles, failed = wd._terminate_processes(100)
+
+    assert targets == {100, 101, 102, 200, 301}
+    assert sorted(handles) == [100, 101, 301]
+    assert failed == [200]
+
+
+def test_terminate_processes_pid_reutilizado(wd, monkeypatch):
+    """PID del lock reutilizado por otro programa: ni él ni sus hijos se tocan"""
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: (pid, True))
+
+    targets, _, _ = wd._terminate_processes(300)  # otro.exe
+
+    assert targets == {100, 200, 301}
+
+
+def test_terminate_processes_sin_pid(wd, monkeypatch):
+    """Sin PID en el lock: solo por nombre de imagen"""
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: (pid, True))
+
+    targets, _, _ = wd._terminate_processes(None)
+
+    assert targets == {100, 200, 301}
+
+
+def test_kill_app_borra_lock_stale(wd, monkeypatch):
+    """kill_app: con todos los procesos terminados borra el lock que dejó la app"""
+    crear_lock_falso(wd.lock_file, TS_VIEJO, pid=100)
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: (pid, True))
+    monkeypatch.setattr(watchdog, "_wait_handles", lambda handles, timeout: 0)
+
+    assert wd.kill_app() is True
+    assert not wd.lock_file.exists()
+
+
+def test_kill_app_procesos_vivos(wd, monkeypatch):
+    """kill_app: si algún proceso sigue vivo retorna False y no toca el lock"""
+    crear_lock_falso(wd.lock_file, TS_VIEJO, pid=100)
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: (pid, True))
+    monkeypatch.setattr(watchdog, "_wait_handles", lambda handles, timeout: 1)
+
+    assert wd.kill_app() is False
+    assert wd.lock_file.exists()
+
+
+def test_kill_app_sin_permisos_conserva_lock(wd, monkeypatch):
+    """kill_app: un proceso que no se pudo terminar deja el lock para reintentar"""
+    crear_lock_falso(wd.lock_file, TS_VIEJO, pid=100)
+    monkeypatch.setattr(watchdog, "_process_snapshot", lambda: PROCESOS)
+    monkeypatch.setattr(watchdog, "_terminate_pid", lambda pid: (None, False) if pid == 100 else (pid, True))
+    monkeypatch.setattr(watchdog, "_wait_handles", lambda handles, timeout: 0)
+
+    assert wd.kill_app() is False
+    assert wd.lock_file.exists()
+
+
+def _watch_en_hilo(wd, segundos, al_llamar=None):
+    """Corre watch_app_status en un hilo durante segundos y retorna los estados recibidos"""
+    estados = []
+    stop = threading.Event()
+
+    def callback(estado):
+        estados.append(estado)
+        if al_llamar:
+            al_llamar(estados)
+
+    hilo = threading.Thread(target=wd.watch_app_status, args=(callback, stop))
+    hilo.start()
+    stop.wait(segundos)
+    stop.set()
+    hilo.join(5)
+    assert not hilo.is_alive()
+    return estados
+
+
+def test_watch_app_status_sin_cambios_no_repite(tmp_path):
+    """Sin cambios en el lock ni en el estado, el timer no vuelve a llamar al callback"""
+    wd = watchdog.AppWatchdog(app_name="test_app.exe", lock_file=str(tmp_path / "test_app.lock"),
+                              timeout_minutes=0.2 / 60)  # timer cada 0.1s
+
+    assert _watch_en_hilo(wd, 0.5) == ["not_running"]
+
+
+def test_watch_app_status_transiciones(tmp_path):
+    """Lock que aparece (running_ok) y deja de moverse (hung): un callback por cambio"""
+    wd = watchdog.AppWatchdog(app_name="test_app.exe", lock_file=str(tmp_path / "test_app.lock"),
+                              timeout_minutes=1 / 60)  # 'hung' al segundo, timer cada 0.5s
+
+    def crear(estados):
+        if estados == ["not_running"]:
+            wd.lock_file.write_text(LOCK_JSON % (TS_FRESCO, 9999))  # mtime = ahora
+
+    assert _watch_en_hilo(wd, 2, crear) == ["not_running", "running_ok", "hung"]